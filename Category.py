@@ -1,4 +1,4 @@
-from typing import Optional, List
+from typing import Iterator, Optional, List
 
 from pydantic import BaseModel
 
@@ -19,24 +19,33 @@ class Category(BaseModel):
 
     def ascii_tree(self, prefix: str = "", is_last: bool = True) -> str:
         """
-        Recursively generate an ASCII tree overview of the hierarchy.
+        Generate an ASCII tree overview of the hierarchy.
 
         Parameters:
-          - prefix: a string used to format the tree structure (for recursion).
+          - prefix: a string used to format the tree structure (e.g. when drawing a subtree).
           - is_last: a boolean indicating if this node is the last child of its parent.
 
         Returns:
           A string representing the ASCII tree starting from this Category.
         """
-        # Determine the branch marker for the current node.
-        branch = "└─ " if is_last else "├─ "
-        tree_str = f"{prefix}{branch}{self.name} (Code: {self.code})\n"
-        # Prepare the prefix for the children.
-        child_prefix = prefix + ("    " if is_last else "│   ")
-        for i, child in enumerate(self.children):
-            is_last_child = (i == len(self.children) - 1)
-            tree_str += child.ascii_tree(child_prefix, is_last_child)
-        return tree_str
+        return "".join(f"{line}\n" for line in self.iter_ascii_tree(prefix, is_last))
+
+    def iter_ascii_tree(self, prefix: str = "", is_last: bool = True) -> Iterator[str]:
+        """
+        Lazily yield the lines of `ascii_tree` (without line breaks). The tree is walked with an
+        explicit stack, so arbitrarily deep hierarchies do not hit the recursion limit.
+        """
+        stack = [(self, prefix, is_last)]
+        while stack:
+            node, prefix, is_last = stack.pop()
+            # Determine the branch marker for the current node.
+            branch = "└─ " if is_last else "├─ "
+            yield f"{prefix}{branch}{node.name} (Code: {node.code})"
+            # Prepare the prefix for the children.
+            child_prefix = prefix + ("    " if is_last else "│   ")
+            # Pushed in reverse, so children are yielded in their original order.
+            for i in reversed(range(len(node.children))):
+                stack.append((node.children[i], child_prefix, i == len(node.children) - 1))
 
     class Config:
         arbitrary_types_allowed = True
@@ -1,6 +1,8 @@
+import time
+
 from dotenv import load_dotenv
 
-from classifiers import VectorClassifier, recursive_classify
+from classifiers import VectorClassifier, classify_batch, recursive_classify
 from test.hierarchy_build import build_full_hierarchy
 from test.test_items import get_test_line_items
 from vector_embedding import load_hierarchy_into_chroma, get_vector_store
@@ -30,15 +32,31 @@ if __name__ == "__main__":
     print("\n=== Test Line Items and Expected Classification Paths ===")
     for line_item, expected_path in test_line_items.items():
         # Classify the line item
+        embedding_calls_before = classifier.embedding_calls
+        start = time.perf_counter()
         result = recursive_classify(line_item=line_item,
                                     category=hierarchy_roots,
                                     classifier=classifier)
+        elapsed_ms = (time.perf_counter() - start) * 1000
 
         result_list = [x[0].name for x in result]
 
         print(f"Line Item: '{line_item}'")
         print(f"  Expected Path: {expected_path}")
         print(f"  Result: {result_list}")
+        print(f"  Latency: {elapsed_ms:.1f} ms, "
+              f"embedding calls: {classifier.embedding_calls - embedding_calls_before}, levels: {len(result)}")
+
+    # Classify the same items with the batched, level-synchronous API and check both paths agree.
+    line_items = list(test_line_items)
+    start = time.perf_counter()
+    batch_results = classify_batch(line_items=line_items, root=hierarchy_roots, classifier=classifier)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    mismatches = [line_item for line_item, batch_result in zip(line_items, batch_results)
+                  if [x[0].code for x in batch_result] !=
+                  [x[0].code for x in recursive_classify(line_item, hierarchy_roots, classifier)]]
+    print(f"\nBatch of {len(line_items)} items classified in {elapsed_ms:.1f} ms, "
+          f"mismatches against recursive_classify: {mismatches}")
 
 
     # results = vectorstore.similarity_search_with_score(
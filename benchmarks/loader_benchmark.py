@@ -0,0 +1,63 @@
+"""
+Compare the row-by-row Excel loader with the chunked, vectorized table loader.
+
+    python -m benchmarks.loader_benchmark --rows 50000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from excel_loaders import load_hierarchy_from_excel_levels, load_hierarchy_from_table
+
+
+def make_taxonomy(rows: int, branching: int = 12, depth: int = 4) -> pd.DataFrame:
+    """
+    Synthetic taxonomy export: one path per row, with a few rows ending above the last level.
+    """
+    data = {}
+    for level in range(1, depth + 1):
+        data[f"L{level}"] = [" / ".join(f"Node {(i // branching ** (depth - d)) % branching}"
+                                        for d in range(1, level + 1))
+                             for i in range(rows)]
+    df = pd.DataFrame(data)
+    df.loc[df.index % 7 == 0, f"L{depth}"] = None
+    return df
+
+
+def measure(label: str, load, file_path: str, rows: int):
+    start = time.perf_counter()
+    roots = load(file_path)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed:8.2f} s {rows / elapsed:12,.0f} rows/s")
+    return roots
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--chunksize", type=int, default=100_000)
+    args = parser.parse_args()
+
+    df = make_taxonomy(args.rows)
+    with tempfile.TemporaryDirectory() as directory:
+        paths = {extension: os.path.join(directory, f"taxonomy{extension}")
+                 for extension in (".xlsx", ".csv", ".parquet")}
+        df.to_excel(paths[".xlsx"], index=False)
+        df.to_csv(paths[".csv"], index=False)
+        df.to_parquet(paths[".parquet"], index=False)
+
+        print(f"{args.rows:,} rows")
+        before = measure("before: iterrows (xlsx)", load_hierarchy_from_excel_levels, paths[".xlsx"], args.rows)
+        for extension, file_path in paths.items():
+            after = measure(f"after: vectorized ({extension[1:]})",
+                            lambda path: load_hierarchy_from_table(path, chunksize=args.chunksize),
+                            file_path, args.rows)
+            same = ([root.ascii_tree() for root in before] == [root.ascii_tree() for root in after])
+            print(f"{'':<28} same tree as before: {same}")
+
+
+if __name__ == "__main__":
+    main()
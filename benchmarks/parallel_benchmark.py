@@ -0,0 +1,56 @@
+"""
+Items/sec of multi-process classification at 1, 2, 4 and 8 workers, with an offline fake embedder.
+
+    python -m benchmarks.parallel_benchmark --items 20000 --latency 0.005
+"""
+import argparse
+import functools
+import tempfile
+import time
+
+from classifiers import classify_batch
+from compact_hierarchy import CompactHierarchy
+from fakes import FakeLatencyEmbeddings
+from hierarchy_index import HierarchyVectorIndex
+from parallel import classify_parallel, save_worker_index
+from test.hierarchy_build import build_full_hierarchy
+from test.test_items import get_test_line_items
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=20_000)
+    parser.add_argument("--chunk-size", type=int, default=256)
+    parser.add_argument("--latency", type=float, default=0.005, help="Seconds per fake embedding call.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    test_items = list(get_test_line_items())
+    line_items = [f"{test_items[i % len(test_items)]} #{i}" for i in range(args.items)]
+    embeddings_factory = functools.partial(FakeLatencyEmbeddings, latency=args.latency)
+
+    with tempfile.TemporaryDirectory() as directory:
+        save_worker_index(build_full_hierarchy(), embeddings_factory(), directory)
+
+        # Reference: the same chunks classified in this process.
+        index = HierarchyVectorIndex.load(directory, embeddings_factory())
+        root = CompactHierarchy.load(directory).root
+        start = time.perf_counter()
+        expected = []
+        for i in range(0, len(line_items), args.chunk_size):
+            expected.extend([[category.code for category, _, _ in path]
+                             for path in classify_batch(line_items[i:i + args.chunk_size], root, index)])
+        elapsed = time.perf_counter() - start
+        print(f"{'in-process':>12}: {len(line_items) / elapsed:10,.0f} items/s")
+
+        for workers in args.workers:
+            start = time.perf_counter()
+            paths = classify_parallel(line_items, directory, embeddings_factory,
+                                      workers=workers, chunk_size=args.chunk_size)
+            elapsed = time.perf_counter() - start
+            same = [[code for code, _, _ in path] for path in paths] == expected
+            print(f"{workers:>4} workers: {len(line_items) / elapsed:10,.0f} items/s (same results: {same})")
+
+
+if __name__ == "__main__":
+    main()
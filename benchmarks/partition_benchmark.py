@@ -0,0 +1,91 @@
+"""
+Latency of one VectorClassifier decision against taxonomy size, for the sibling filter on the
+parent's document ID compared with the former filter on the parent's name and the level. Each
+decision is timed through `VectorClassifier.score`, i.e. the filtered fetch of the siblings'
+embeddings and their scoring, which is what the classifier does at every level.
+
+    python -m benchmarks.partition_benchmark --branching 10 --depths 2 3 4 --queries 200
+
+The demo hierarchy is measured first: its many "Standard" nodes share a name, so the name filter
+matches the children of all of them. The report shows how many rows each filter matches, i.e. the
+size of the set a search has to consider, besides the latency.
+"""
+import argparse
+import random
+import time
+import uuid
+from typing import Dict, List
+
+import chromadb
+import numpy as np
+from langchain_chroma import Chroma
+
+from Category import Category
+from benchmarks.synthetic import generate_hierarchy
+from classifiers import VectorClassifier
+from fakes import FakeLatencyEmbeddings
+from test.hierarchy_build import build_full_hierarchy
+from vector_embedding import sync_hierarchy_into_chroma
+
+
+def name_filter(candidates: List[Category]) -> dict:
+    # The filter VectorClassifier used before documents carried their parent's ID.
+    parent = candidates[0].parent
+    return {"$and": [{f"L{parent.level}": {"$eq": parent.name}}, {"level": {"$eq": candidates[0].level}}]}
+
+
+class NameFilterVectorClassifier(VectorClassifier):
+    _sibling_filter = staticmethod(name_filter)
+
+
+def measure_filter(classifier: VectorClassifier, decisions: List[List[Category]],
+                   queries: List[List[float]]) -> Dict[str, float]:
+    latencies = []
+    for candidates, query in zip(decisions, queries):
+        start = time.perf_counter()
+        classifier.score("", candidates, query)
+        latencies.append(time.perf_counter() - start)
+    latencies_ms = np.asarray(latencies) * 1000
+    matched = [len(classifier.vectorstore.get(where=classifier._sibling_filter(candidates), include=[])["ids"])
+               for candidates in decisions]
+    return {"p50_ms": float(np.percentile(latencies_ms, 50)), "p95_ms": float(np.percentile(latencies_ms, 95)),
+            "mean_rows_matched": float(np.mean(matched))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--branching", type=int, default=10, help="Children per non-leaf node.")
+    parser.add_argument("--depths", type=int, nargs="+", default=[2, 3, 4], help="Taxonomy depths to measure.")
+    parser.add_argument("--queries", type=int, default=200, help="Decisions timed per taxonomy.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    embeddings = FakeLatencyEmbeddings()
+    taxonomies = [("demo", build_full_hierarchy())]
+    taxonomies += [("synthetic", generate_hierarchy(depth, args.branching, seed=args.seed).root)
+                   for depth in args.depths]
+    print(f"{'taxonomy':<10} {'nodes':>8} {'filter':<10} {'p50 ms':>8} {'p95 ms':>8} {'rows matched':>13}")
+    for name, root in taxonomies:
+        vectorstore = Chroma(collection_name=f"partition-{uuid.uuid4().hex}", embedding_function=embeddings,
+                             client=chromadb.EphemeralClient())
+        nodes = sync_hierarchy_into_chroma(vectorstore, root)["embedded"]
+
+        # Random decisions: a node with children, and a query made of one child's name.
+        decisions = []
+        for _ in range(args.queries):
+            parent = root
+            while rng.choice(parent.children).children and rng.random() < 0.8:
+                parent = rng.choice(parent.children)
+            decisions.append(list(parent.children))
+        queries = embeddings.embed_documents([rng.choice(candidates).name.lower() for candidates in decisions])
+
+        for label, classifier in (("parent_id", VectorClassifier(vectorstore)),
+                                  ("name", NameFilterVectorClassifier(vectorstore))):
+            result = measure_filter(classifier, decisions, queries)
+            print(f"{name:<10} {nodes:>8} {label:<10} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} "
+                  f"{result['mean_rows_matched']:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Offline throughput/latency benchmark of the classifiers on synthetic hierarchies.
+
+    python -m benchmarks.run --depth 3 --branching 10 --items 200 --output results.json
+
+Every classifier runs against fake embedding/chat models with tunable latency, through both
+`recursive_classify` (one item at a time) and `classify_batch`. For each run the benchmark reports
+items/s, p50/p95/p99 latency per item, peak RSS, backend calls per item, path accuracy and the
+instrumentation summary (time per level and per backend), and emits everything as JSON so runs
+can be compared. Every classifier runs in a fresh process, so its peak RSS is its own.
+"""
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import sys
+import time
+import uuid
+from typing import Dict, List, Tuple
+
+import chromadb
+import numpy as np
+from langchain_chroma import Chroma
+
+from benchmarks.synthetic import generate_hierarchy, generate_line_items
+from classifiers import (BaseClassifier, LangChainLLMClassifier, VectorClassifier, classify_batch,
+                         recursive_classify)
+from fakes import FakeLatencyChatModel, FakeLatencyEmbeddings
+from hierarchy_index import HierarchyVectorIndex
+from instrumentation import measure
+from lexical_classifier import LexicalClassifier
+from vector_embedding import sync_hierarchy_into_chroma
+
+CLASSIFIERS = ("vector", "index", "llm", "lexical")
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def build_classifier(name: str, root, embeddings: FakeLatencyEmbeddings,
+                     model: FakeLatencyChatModel, items_per_request: int = 1) -> BaseClassifier:
+    if name == "vector":
+        vectorstore = Chroma(collection_name=f"benchmark-{uuid.uuid4().hex}", embedding_function=embeddings,
+                             client=chromadb.EphemeralClient())
+        sync_hierarchy_into_chroma(vectorstore, root)
+        return VectorClassifier(vectorstore)
+    if name == "index":
+        return HierarchyVectorIndex.build(root, embeddings)
+    if name == "lexical":
+        return LexicalClassifier(root)
+    return LangChainLLMClassifier(model=model, items_per_request=items_per_request)
+
+
+def run_mode(mode: str, classifier: BaseClassifier, root, line_items: List[Tuple[str, List[str]]],
+             batch_size: int) -> Tuple[List[float], List[List[str]], float]:
+    """
+    Per-item latencies (seconds), predicted code paths and total wall time of one mode.
+    """
+    latencies, predictions = [], []
+    start = time.perf_counter()
+    if mode == "recursive_classify":
+        for line_item, _ in line_items:
+            item_start = time.perf_counter()
+            path = recursive_classify(line_item, root, classifier)
+            latencies.append(time.perf_counter() - item_start)
+            predictions.append([category.code for category, _, _ in path])
+    else:
+        for i in range(0, len(line_items), batch_size):
+            batch = [line_item for line_item, _ in line_items[i:i + batch_size]]
+            batch_start = time.perf_counter()
+            paths = classify_batch(batch, root, classifier)
+            # Every item of a batch waits for the whole batch.
+            latencies.extend([time.perf_counter() - batch_start] * len(batch))
+            predictions.extend([[category.code for category, _, _ in path] for path in paths])
+    return latencies, predictions, time.perf_counter() - start
+
+
+def benchmark_classifier(name: str, args: argparse.Namespace) -> List[Dict]:
+    """
+    Results of both modes for one classifier. Meant to run in a process of its own.
+    """
+    hierarchy = generate_hierarchy(args.depth, args.branching, seed=args.seed)
+    line_items = generate_line_items(hierarchy, args.items, seed=args.seed)
+    root = hierarchy.root
+    baseline_rss_mb = peak_rss_mb()
+    embeddings = FakeLatencyEmbeddings(latency=args.embedding_latency)
+    model = FakeLatencyChatModel(latency=args.llm_latency)
+    setup_start = time.perf_counter()
+    classifier = build_classifier(name, root, embeddings, model, args.llm_items_per_request)
+    setup_seconds = time.perf_counter() - setup_start
+
+    results = []
+    for mode in ("recursive_classify", "classify_batch"):
+        embedding_calls, embedded_texts, llm_calls = embeddings.calls, embeddings.texts, model.calls
+        with measure() as stats:
+            latencies, predictions, elapsed = run_mode(mode, classifier, root, line_items, args.batch_size)
+        latencies_ms = np.asarray(latencies) * 1000
+        results.append({
+            "classifier": name,
+            "mode": mode,
+            "setup_seconds": setup_seconds,
+            "items_per_second": len(line_items) / elapsed,
+            "latency_ms": {f"p{p}": float(np.percentile(latencies_ms, p)) for p in (50, 95, 99)},
+            # Peak of the classifier's process so far, and its growth over the process before the
+            # classifier was built (interpreter, imports and the synthetic data).
+            "peak_rss_mb": peak_rss_mb(),
+            "rss_increase_mb": peak_rss_mb() - baseline_rss_mb,
+            "calls_per_item": {
+                "embedding_requests": (embeddings.calls - embedding_calls) / len(line_items),
+                "embedded_texts": (embeddings.texts - embedded_texts) / len(line_items),
+                "llm_requests": (model.calls - llm_calls) / len(line_items),
+            },
+            "path_accuracy": float(np.mean([prediction == expected for prediction, (_, expected)
+                                            in zip(predictions, line_items)])),
+            "instrumentation": stats.summary(),
+        })
+        print(f"{name:>7} {mode:<19} {results[-1]['items_per_second']:10,.1f} items/s  "
+              f"p50 {results[-1]['latency_ms']['p50']:8.2f} ms  "
+              f"p99 {results[-1]['latency_ms']['p99']:8.2f} ms", file=sys.stderr)
+    return results
+
+
+def benchmark(args: argparse.Namespace) -> Dict:
+    results = []
+    # A fresh ("spawn") process per classifier: ru_maxrss only ever grows within a process.
+    context = multiprocessing.get_context("spawn")
+    for name in args.classifiers:
+        with context.Pool(1) as pool:
+            results.extend(pool.apply(benchmark_classifier, (name, args)))
+
+    nodes = len(generate_hierarchy(args.depth, args.branching, seed=args.seed))
+    return {
+        "config": {**vars(args), "nodes": nodes, "python": platform.python_version()},
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--depth", type=int, default=3, help="Levels below the root.")
+    parser.add_argument("--branching", type=int, default=5, help="Children per non-leaf node.")
+    parser.add_argument("--items", type=int, default=200, help="Number of synthetic line items.")
+    parser.add_argument("--batch-size", type=int, default=100, help="Line items per classify_batch call.")
+    parser.add_argument("--classifiers", nargs="+", choices=CLASSIFIERS, default=list(CLASSIFIERS))
+    parser.add_argument("--embedding-latency", type=float, default=0.01, help="Seconds per embedding request.")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds per LLM request.")
+    parser.add_argument("--llm-items-per-request", type=int, default=1,
+                        help="Line items the llm classifier decides per request in classify_batch.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout.")
+    args = parser.parse_args()
+
+    report = benchmark(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Load test of the classification service (service.py) with offline fake backends.
+
+    python -m benchmarks.service_benchmark --classifier index --requests 2000 --concurrency 64
+
+`--concurrency` clients connect over TCP and each sends its share of `--requests` one at a time,
+waiting for every answer before the next request. Line items are drawn from a pool of
+`--distinct-items` synthetic ones, so identical line items are in flight together as in real
+invoice traffic. The same load is run against a server handling every request on its own with
+`recursive_classify` in a worker thread (like a plain web handler) and against the micro-batching
+service, reporting requests/s, p50/p95/p99 latency and backend calls per request of each.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from benchmarks.run import CLASSIFIERS, build_classifier
+from benchmarks.synthetic import generate_hierarchy, generate_line_items
+from classifiers import recursive_classify
+from fakes import FakeLatencyChatModel, FakeLatencyEmbeddings
+from service import MicroBatcher, start_server
+
+
+async def run_clients(port: int, line_items: List[str], concurrency: int) -> List[float]:
+    """
+    Latency in seconds of every request, sent by `concurrency` clients one request at a time.
+    """
+    latencies = []
+
+    async def client(requests: List[str]):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        for request_id, line_item in enumerate(requests):
+            start = time.perf_counter()
+            writer.write(json.dumps({"id": request_id, "line_item": line_item}).encode("utf-8") + b"\n")
+            await writer.drain()
+            response = json.loads(await reader.readline())
+            latencies.append(time.perf_counter() - start)
+            if "error" in response:
+                raise RuntimeError(response["error"])
+        writer.close()
+        await writer.wait_closed()
+
+    await asyncio.gather(*(client(line_items[i::concurrency]) for i in range(concurrency)))
+    return latencies
+
+
+async def load_test(mode: str, classifier_factory: Callable, root, line_items: List[str],
+                    args: argparse.Namespace) -> Dict:
+    embeddings = FakeLatencyEmbeddings(latency=args.embedding_latency)
+    model = FakeLatencyChatModel(latency=args.llm_latency)
+    classifier = classifier_factory(embeddings, model)
+    embedding_calls, llm_calls = embeddings.calls, model.calls
+
+    batcher = None
+    if mode == "micro_batch":
+        batcher = MicroBatcher(root, classifier, max_batch_size=args.max_batch_size,
+                               max_wait=args.max_wait_ms / 1000, max_queue_size=args.max_queue_size)
+        await batcher.start()
+        classify = batcher.classify
+    else:
+        async def classify(line_item: str):
+            return await asyncio.to_thread(recursive_classify, line_item, root, classifier)
+
+    server = await start_server(classify, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    start = time.perf_counter()
+    latencies = await run_clients(port, line_items, args.concurrency)
+    elapsed = time.perf_counter() - start
+    server.close()
+    await server.wait_closed()
+    if batcher is not None:
+        await batcher.stop()
+
+    latencies_ms = np.asarray(latencies) * 1000
+    return {
+        "mode": mode,
+        "requests_per_second": len(line_items) / elapsed,
+        "latency_ms": {f"p{p}": float(np.percentile(latencies_ms, p)) for p in (50, 95, 99)},
+        "calls_per_request": {"embedding_requests": (embeddings.calls - embedding_calls) / len(line_items),
+                              "llm_requests": (model.calls - llm_calls) / len(line_items)},
+        "service": batcher.stats() if batcher is not None else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--classifier", choices=CLASSIFIERS, default="index")
+    parser.add_argument("--depth", type=int, default=3, help="Levels below the root.")
+    parser.add_argument("--branching", type=int, default=5, help="Children per non-leaf node.")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests sent in total.")
+    parser.add_argument("--concurrency", type=int, default=64, help="Clients sending requests at the same time.")
+    parser.add_argument("--distinct-items", type=int, default=500, help="Size of the pool of line items.")
+    parser.add_argument("--embedding-latency", type=float, default=0.01, help="Seconds per embedding request.")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds per LLM request.")
+    parser.add_argument("--llm-items-per-request", type=int, default=1,
+                        help="Line items the llm classifier decides per request in a micro-batch.")
+    parser.add_argument("--max-batch-size", type=int, default=64, help="Most line items per micro-batch.")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0,
+                        help="Milliseconds a micro-batch waits for more line items after its first one.")
+    parser.add_argument("--max-queue-size", type=int, default=1024,
+                        help="Most line items waiting to be batched before requests are held back.")
+    parser.add_argument("--modes", nargs="+", choices=("per_request", "micro_batch"),
+                        default=["per_request", "micro_batch"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout.")
+    args = parser.parse_args()
+
+    hierarchy = generate_hierarchy(args.depth, args.branching, seed=args.seed)
+    pool = [line_item for line_item, _ in generate_line_items(hierarchy, args.distinct_items, seed=args.seed)]
+    rng = random.Random(args.seed)
+    line_items = [rng.choice(pool) for _ in range(args.requests)]
+
+    def classifier_factory(embeddings, model):
+        return build_classifier(args.classifier, hierarchy.root, embeddings, model, args.llm_items_per_request)
+
+    results = []
+    for mode in args.modes:
+        results.append(asyncio.run(load_test(mode, classifier_factory, hierarchy.root, line_items, args)))
+        print(f"{mode:<12} {results[-1]['requests_per_second']:10,.1f} requests/s  "
+              f"p50 {results[-1]['latency_ms']['p50']:8.2f} ms  p95 {results[-1]['latency_ms']['p95']:8.2f} ms  "
+              f"p99 {results[-1]['latency_ms']['p99']:8.2f} ms")
+
+    report = {"config": vars(args), "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Synthetic hierarchies and line items of configurable size, for offline benchmarks.
+"""
+import random
+from typing import List, Tuple
+
+from compact_hierarchy import CompactHierarchy
+
+WORDS = [
+    "steel", "paper", "cable", "laptop", "chair", "desk", "printer", "toner", "shirt", "jacket", "lamp",
+    "monitor", "router", "battery", "adapter", "folder", "marker", "cleaner", "glove", "helmet", "valve",
+    "pump", "filter", "sensor", "switch", "bracket", "screw", "bolt", "tape", "label", "box", "pallet",
+    "coffee", "water", "towel", "soap", "license", "service", "repair", "rental", "training", "freight",
+    "storage", "cabinet", "shelf", "badge", "phone", "headset", "camera", "speaker", "keyboard", "mouse",
+]
+QUALIFIERS = ["standard", "premium", "economy", "industrial", "office", "outdoor", "compact", "heavy", "mini", "pro"]
+NOISE = ["pcs", "qty", "ref", "lot", "unit", "pack", "set", "incl", "vat", "order"]
+
+
+def generate_hierarchy(depth: int, branching: int, seed: int = 0) -> CompactHierarchy:
+    """
+    Tree with a root and `depth` levels below it, where every non-leaf node has `branching` children
+    (1 + branching + ... + branching ** depth nodes, e.g. depth=5, branching=10 gives ~10^5 nodes).
+    """
+    rng = random.Random(seed)
+    codes, names, descriptions, levels, parents = ["root"], ["All Categories"], ["Root category"], [0], [-1]
+    frontier = [0]
+    for level in range(1, depth + 1):
+        next_frontier = []
+        for parent in frontier:
+            for i in range(1, branching + 1):
+                name = f"{rng.choice(QUALIFIERS).title()} {rng.choice(WORDS).title()} {rng.choice(WORDS).title()}"
+                codes.append(f"{codes[parent]}.{i}" if parent else f"{i}")
+                names.append(name)
+                descriptions.append(f"{name} under {names[parent]}")
+                levels.append(level)
+                parents.append(parent)
+                next_frontier.append(len(codes) - 1)
+        frontier = next_frontier
+    return CompactHierarchy(codes, names, levels, parents, descriptions)
+
+
+def generate_line_items(hierarchy: CompactHierarchy, count: int, seed: int = 0) -> List[Tuple[str, List[str]]]:
+    """
+    Line items built from words of a random leaf's path plus noise, with the expected path of codes
+    (excluding the root) for each.
+    """
+    rng = random.Random(seed)
+    leaves = [index for index in range(len(hierarchy)) if not len(hierarchy.child_indices(index))]
+    line_items = []
+    for _ in range(count):
+        leaf = rng.choice(leaves)
+        path = hierarchy.path(leaf)[1:]
+        words = hierarchy.names[leaf].lower().split() + rng.sample(hierarchy.names[int(hierarchy.parents[leaf])]
+                                                                   .lower().split(), 1)
+        words += [rng.choice(NOISE), str(rng.randint(1, 500))]
+        rng.shuffle(words)
+        line_items.append((" ".join(words), list(path)))
+    return line_items
@@ -1,13 +1,29 @@
+import asyncio
+import hashlib
+import json
+import time
 from abc import ABC, abstractmethod
-from typing import List, Tuple, Optional
+from collections import defaultdict
+from typing import Any, Dict, List, Tuple, Optional
 
+import numpy as np
+import openai
 from langchain.chat_models import init_chat_model
 from langchain_chroma import Chroma
+from langchain_core.embeddings import Embeddings
+from langchain_core.exceptions import OutputParserException
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
 from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.prompt_values import PromptValue
 from pydantic import BaseModel, Field
 
 from Category import Category
+from decision_cache import DecisionCache
+from instrumentation import embedding_request, get_instrumentation
 from langchain_core.prompts import PromptTemplate
+from utils import normalize_rows
+from vector_embedding import category_code_path, category_document_id
 
 
 class ClassificationResult(BaseModel):
@@ -18,71 +34,290 @@ class ClassificationResult(BaseModel):
         description="a string containing a warning message if the classification is ambiguous, or an empty string if not")
 
 
+class ItemClassificationResult(ClassificationResult):
+    item_number: int = Field(description="the number of the line item as listed (starting at 1)")
+
+
+class BatchClassificationResult(BaseModel):
+    results: List[ItemClassificationResult] = Field(
+        description="one classification per line item, in the order the line items are listed")
+
+
 class BaseClassifier(ABC):
+    def encode(self, line_item: str) -> Any:
+        """
+        Compute a query representation of the line item (e.g. its embedding vector) once,
+        so it can be reused for the decision at every level of the hierarchy.
+        Classifiers that work on the raw text return None.
+        """
+        return None
+
+    async def aencode(self, line_item: str) -> Any:
+        """
+        Async variant of `encode`. Defaults to running `encode` in a worker thread, so a blocking
+        embedding request does not hold up the event loop.
+        """
+        return await asyncio.to_thread(self.encode, line_item)
+
     @abstractmethod
     def classify(
-            self, line_item: str, candidates: List[Category]
+            self, line_item: str, candidates: List[Category], query: Optional[Any] = None
     ) -> Tuple[Category, float, Optional[str]]:
         """
         Given the invoice line item text and a list of candidate categories, return:
           - The selected category,
           - A confidence score between 0 and 1,
           - A warning message if multiple candidates are similarly likely.
+
+        `query` is the precomputed representation returned by `encode` for this line item, if any.
         """
         pass
 
+    async def aclassify(
+            self, line_item: str, candidates: List[Category], query: Optional[Any] = None
+    ) -> Tuple[Category, float, Optional[str]]:
+        """
+        Async variant of `classify`. Defaults to running `classify` in a worker thread.
+        """
+        return await asyncio.to_thread(self.classify, line_item, candidates, query)
 
-class VectorClassifier(BaseClassifier):
-    def __init__(self, vectorstore: Chroma):
-        # In a real implementation, initialize your vector database or embedding model here.
-        self.vectorstore = vectorstore
+    def encode_batch(self, line_items: List[str]) -> List[Any]:
+        """
+        Compute the query representations of many line items. Classifiers backed by a remote model
+        should override this to make a single batched call.
+        """
+        return [self.encode(line_item) for line_item in line_items]
+
+    def classify_group(
+            self, line_items: List[str], candidates: List[Category], queries: List[Any]
+    ) -> List[Tuple[Category, float, Optional[str]]]:
+        """
+        Classify several line items that all wait at the same parent node (i.e. share `candidates`).
+        Defaults to one `classify` call per item; override to score the whole group in one pass.
+        """
+        return [self.classify(line_item, candidates, query=query)
+                for line_item, query in zip(line_items, queries)]
+
+    def score_group(
+            self, line_items: List[str], candidates: List[Category], queries: List[Any]
+    ) -> np.ndarray:
+        """
+        Similarity of every line item (rows) to every candidate (columns), higher is better.
+        Only implemented by classifiers that rank candidates by a score.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not score candidates.")
+
+    def score(self, line_item: str, candidates: List[Category], query: Optional[Any] = None) -> np.ndarray:
+        """
+        Similarity of the line item to each candidate, higher is better.
+        """
+        if query is None:
+            query = self.encode(line_item)
+        return self.score_group([line_item], candidates, [query])[0]
+
+
+class ScoringClassifier(BaseClassifier):
+    """
+    Base of the classifiers that rank candidates by a similarity score (VectorClassifier,
+    HierarchyVectorIndex, LexicalClassifier). Subclasses implement `score_group`; the decision is the
+    best scoring candidate with its softmax probability as confidence and a warning when another
+    candidate scores within `margin` of it (see `decide_by_margin`). If scoring fails, the last
+    candidate is returned with confidence 0 and the error as warning.
+    """
+
+    # Warning of a decision where no candidate got a score (e.g. none was found in the index).
+    unscored_warning = "None of the candidates could be scored."
+
+    def __init__(self, margin: float = 0.05, temperature: float = 0.05):
+        """
+        Parameters:
+          - margin: a decision whose best and second best similarities are closer than this gets a warning.
+          - temperature: softmax temperature turning the similarities into the reported confidence.
+        """
+        self.margin = margin
+        self.temperature = temperature
+
+    @staticmethod
+    def _candidate_scores(similarities: np.ndarray, positions: List[Optional[int]], n_candidates: int) -> np.ndarray:
+        """
+        Scores of the candidates (columns) from the similarities of the rows found for them, where
+        `positions[j]` is the candidate of column j of `similarities` (None if it is no candidate).
+        A candidate scores as its best matching row, and -inf if no row matches it.
+        """
+        scores = np.full((similarities.shape[0], n_candidates), -np.inf, dtype=np.float32)
+        if None not in positions and len(set(positions)) == len(positions):
+            # One row per candidate (always so for row-range indexes): a plain scatter is much cheaper.
+            scores[:, positions] = similarities
+            return scores
+        columns = [column for column, position in enumerate(positions) if position is not None]
+        np.maximum.at(scores, (slice(None), [positions[column] for column in columns]), similarities[:, columns])
+        return scores
+
+    def _undecidable(self, scores: np.ndarray) -> np.ndarray:
+        """
+        Rows of a score matrix that cannot be decided by their scores and take `_fallback_decision`.
+        """
+        return ~np.isfinite(scores).any(axis=1)
+
+    def _fallback_decision(
+            self, scores: np.ndarray, candidates: List[Category]
+    ) -> Tuple[Category, float, Optional[str]]:
+        get_instrumentation().count("fallbacks")
+        return candidates[-1], 0.0, self.unscored_warning
+
+    def _decide_all(
+            self, scores: np.ndarray, candidates: List[Category]
+    ) -> List[Tuple[Category, float, Optional[str]]]:
+        """
+        Decisions for every row of a score matrix, computed for the whole matrix at once
+        (see `decide_by_margin`); only the undecidable rows are handled one by one.
+        """
+        best, margins, confidences = _margin_decisions(scores, self.temperature)
+        ambiguous = margins < self.margin
+        undecidable = self._undecidable(scores)
+        return [self._fallback_decision(scores[row], candidates) if undecidable[row]
+                else (candidates[best[row]], confidences[row], _margin_warning(ambiguous[row]))
+                for row in range(len(scores))]
+
+    def _decide(self, scores: np.ndarray, candidates: List[Category]) -> Tuple[Category, float, Optional[str]]:
+        return self._decide_all(scores[None, :], candidates)[0]
 
     def classify(
-            self, line_item: str, candidates: List[Category]
+            self, line_item: str, candidates: List[Category], query: Optional[Any] = None
     ) -> Tuple[Category, float, Optional[str]]:
-        target_level = candidates[0].level
-        parent_item = candidates[0].parent
-        parent_level = parent_item.level
         try:
-            results = self.vectorstore.similarity_search_with_score(query=line_item,
-                                                                    k=1,
-                                                                    filter={"$and":
-                                                                        [
-                                                                            {f"L{parent_level}": {
-                                                                                "$eq": parent_item.name}},
-                                                                            {f"level": {"$eq": target_level}}]
-                                                                    })
-
-            # Document result
-            best_candidate = results[0][0].metadata['name']
-            result_idx = [x.name == best_candidate for x in candidates].index(True)
-            confidence = 1.0
-            warning = ""
+            return self._decide(self.score(line_item, candidates, query), candidates)
         except Exception as e:
-            best_candidate = None
-            result_idx = -1
-            warning = str(e)
-            confidence = 0.0
+            get_instrumentation().count("fallbacks")
+            return candidates[-1], 0.0, str(e)
+
+    def classify_group(
+            self, line_items: List[str], candidates: List[Category], queries: List[Any]
+    ) -> List[Tuple[Category, float, Optional[str]]]:
+        try:
+            scores = self.score_group(line_items, candidates, queries)
+        except Exception as e:
+            get_instrumentation().count("fallbacks", len(line_items))
+            return [(candidates[-1], 0.0, str(e)) for _ in line_items]
+        return self._decide_all(scores, candidates)
+
+
+class VectorClassifier(ScoringClassifier):
+    unscored_warning = "None of the candidates was found in the vector store."
+
+    def __init__(self, vectorstore: Chroma, margin: float = 0.05, temperature: float = 0.05):
+        """
+        Parameters:
+          - vectorstore: Chroma collection holding the hierarchy (see `sync_hierarchy_into_chroma`).
+          - margin, temperature: see ScoringClassifier.
+        """
+        super().__init__(margin=margin, temperature=temperature)
+        self.vectorstore = vectorstore
+        # Number of embedding round-trips made so far (one per line item when `encode` is reused).
+        self.embedding_calls = 0
+
+    def encode(self, line_item: str) -> List[float]:
+        self.embedding_calls += 1
+        with embedding_request([line_item]):
+            return self.vectorstore.embeddings.embed_query(line_item)
+
+    async def aencode(self, line_item: str) -> List[float]:
+        self.embedding_calls += 1
+        with embedding_request([line_item]):
+            return await self.vectorstore.embeddings.aembed_query(line_item)
+
+    def encode_batch(self, line_items: List[str]) -> List[List[float]]:
+        self.embedding_calls += 1
+        with embedding_request(line_items):
+            return self.vectorstore.embeddings.embed_documents(line_items)
+
+    @staticmethod
+    def _sibling_filter(candidates: List[Category]) -> dict:
+        """
+        Chroma metadata filter restricting a search to the children of the candidates' parent.
+        The parent is identified by its document ID, which is unique even where category names
+        repeat across the tree (e.g. the many "Standard" nodes).
+        """
+        return {"parent_id": {"$eq": category_document_id(category_code_path(candidates[0].parent))}}
 
-        # TODO: Implement mechanism as a next step.
-        # Check if any other candidate has a similarity within a small margin (e.g. 0.05) of the best.
-        # similar_count = sum(
-        #     1 for sim in similarities if abs(sim - best_similarity) < 0.05 and sim != best_similarity
-        # )
-        # if similar_count > 0:
-        #     warning = "Multiple candidates have similar similarity scores. Manual review recommended."
-        return candidates[result_idx], confidence, warning
+    def _similarities(self, queries: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+        """
+        Similarities (higher is better) between each query (rows) and each stored vector (columns),
+        derived from the metric of the Chroma collection so the ranking matches `similarity_search`.
+        For normalized embeddings this is the cosine similarity in every supported space.
+        """
+        space = (self.vectorstore._collection.metadata or {}).get("hnsw:space", "l2")
+        if space == "l2":
+            squared_distances = ((queries ** 2).sum(axis=1)[:, None]
+                                 - 2 * queries @ vectors.T
+                                 + (vectors ** 2).sum(axis=1)[None, :])
+            return 1.0 - squared_distances / 2
+        if space == "cosine":
+            queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+            vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        return queries @ vectors.T
+
+    def score_group(
+            self, line_items: List[str], candidates: List[Category], queries: List[List[float]]
+    ) -> np.ndarray:
+        """
+        Fetch the sibling embeddings once and score all queries against them in one vectorized pass,
+        instead of one filtered vector search per line item.
+        """
+        instrumentation = get_instrumentation()
+        instrumentation.count("vector_searches")
+        with instrumentation.timer("vector_search"):
+            siblings = self.vectorstore.get(where=self._sibling_filter(candidates),
+                                            include=["embeddings", "metadatas"])
+        codes = [metadata['code'] for metadata in siblings["metadatas"]]
+        similarities = self._similarities(np.asarray(queries, dtype=np.float32),
+                                          np.asarray(siblings["embeddings"], dtype=np.float32))
+
+        # A candidate scores as its best matching document.
+        position_by_code = {candidate.code: i for i, candidate in enumerate(candidates)}
+        return self._candidate_scores(similarities, [position_by_code.get(code) for code in codes], len(candidates))
 
 
 # === LangChain-based LLM Prompt Template Classifier ===
 class LangChainLLMClassifier(BaseClassifier):
-    def __init__(self, model_name: str = "gpt-4o-mini", temperature: float = 0.0):
+    def __init__(self, model_name: str = "gpt-4o-mini", temperature: float = 0.0,
+                 model: Optional[BaseChatModel] = None, max_retries: int = 3, retry_backoff: float = 1.0,
+                 decision_cache: Optional[DecisionCache] = None, items_per_request: int = 1):
         """
         Initialize with a specific LLM via LangChain.
+
+        Parameters:
+          - model: an already configured chat model to use instead of `model_name` (e.g. a local fake).
+          - max_retries: how often a request is retried when the provider reports a rate limit.
+          - retry_backoff: delay in seconds before the first retry, doubled on every further retry.
+          - decision_cache: if given, decisions are memoized and repeated ones skip the LLM entirely.
+          - items_per_request: with more than 1, `classify_group` (used by `classify_batch`) sends up
+            to this many line items waiting at the same node in one request, so the candidate list
+            and the instructions are paid for once per request instead of once per line item.
         """
-        self.model = init_chat_model(model_name, model_provider="openai")
+        self.model = model if model is not None else init_chat_model(model_name, model_provider="openai")
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.decision_cache = decision_cache
+        self.items_per_request = items_per_request
         self.parser = JsonOutputParser(pydantic_object=ClassificationResult)
-        self.prompt_template = PromptTemplate(
+        self.prompt_template = self._make_prompt_template()
+        self.batch_parser = JsonOutputParser(pydantic_object=BatchClassificationResult)
+        self.batch_prompt_template = self._make_batch_prompt_template()
+        # Identifies the prompt and model, so cached decisions are not reused after either changes.
+        prompts = [self.prompt_template.template, self.parser.get_format_instructions()]
+        if items_per_request > 1:
+            prompts += [self.batch_prompt_template.template, self.batch_parser.get_format_instructions()]
+        self.fingerprint = hashlib.sha256(json.dumps(
+            prompts + [type(self.model).__name__, self.model._identifying_params],
+            sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        # Estimated prompt tokens of batched requests, and of the same line items in per-item requests.
+        self.batched_items = 0
+        self.batched_prompt_tokens = 0
+        self.per_item_prompt_tokens = 0
+
+    def _make_prompt_template(self) -> PromptTemplate:
+        return PromptTemplate(
             input_variables=["line_item", "candidates_text"],
 
             template=(
@@ -96,49 +331,758 @@ class LangChainLLMClassifier(BaseClassifier):
             partial_variables={"format_instructions": self.parser.get_format_instructions()},
         )
 
-    def classify(
-            self, line_item: str, candidates: List[Category]
-    ) -> Tuple[Category, float, Optional[str]]:
+    def _make_batch_prompt_template(self) -> PromptTemplate:
+        return PromptTemplate(
+            input_variables=["line_items_text", "candidates_text"],
+
+            template=(
+                "You are a classification expert. Given the following invoice line items:\n\n"
+                "Line items:\n"
+                "{line_items_text}\n\n"
+                "And the following candidate categories:\n"
+                "{candidates_text}\n\n"
+                "Please select, for every line item, the candidate category that best matches it, "
+                "and return one result per line item with its number as item_number.\n"
+                "{format_instructions}"
+            ),
+            partial_variables={"format_instructions": self.batch_parser.get_format_instructions()},
+        )
+
+    @staticmethod
+    def _line_items_text(line_items: List[str]) -> str:
+        return "\n".join(f"{number}. \"{line_item}\"" for number, line_item in enumerate(line_items, start=1))
+
+    @staticmethod
+    def _candidates_text(candidates: List[Category]) -> str:
         # Build a numbered candidate list
         candidate_lines = []
         for idx, candidate in enumerate(candidates, start=1):
             desc = candidate.description if candidate.description else candidate.name
             candidate_lines.append(f"{idx}. Code: {candidate.code}, Name: {candidate.name}, Description: {desc}")
-        candidates_text = "\n".join(candidate_lines)
+        return "\n".join(candidate_lines)
+
+    @staticmethod
+    def _parse_response(response: dict, candidates: List[Category]) -> Tuple[Category, float, Optional[str]]:
+        selected_index = response.get("selected_index")
+        confidence = response.get("confidence")
+        warning = response.get("warning")
+
+        if not (isinstance(selected_index, int) and 0 <= selected_index < len(candidates)):
+            raise ValueError("Invalid selected_index returned by the LLM.")
+
+        selected_candidate = candidates[selected_index]
+        return selected_candidate, confidence, warning if warning else None
+
+    def _cached(self, line_item: str, candidates: List[Category]) -> Tuple[Optional[str], Optional[Tuple]]:
+        """
+        Cache key of the decision and the cached result, if any.
+        """
+        if self.decision_cache is None:
+            return None, None
+        key = DecisionCache.key(line_item, [self._decision_code(candidate) for candidate in candidates],
+                                self.fingerprint)
+        decision = self.decision_cache.get(key)
+        if decision is None:
+            return key, None
+        code, confidence, warning = decision
+        selected_candidate = next((candidate for candidate in candidates
+                                   if self._decision_code(candidate) == code), None)
+        return key, (selected_candidate, confidence, warning) if selected_candidate is not None else None
+
+    def _store(self, key: Optional[str], result: Tuple[Category, float, Optional[str]]):
+        if key is not None:
+            self.decision_cache.put(key, (self._decision_code(result[0]), result[1], result[2]))
+
+    def _decision_code(self, candidate: Category) -> str:
+        """
+        Identifies a candidate in cached decisions. Siblings have distinct codes, so the code suffices.
+        """
+        return candidate.code
+
+    @staticmethod
+    def _fallback(candidates: List[Category], e: Exception) -> Tuple[Category, float, Optional[str]]:
+        # Fallback in case of error
+        print(f"Error during LangChain classification: {e}. Falling back to default candidate.")
+        get_instrumentation().count("fallbacks")
+        return candidates[0], 0.5, "Fallback due to error."
+
+    @staticmethod
+    def _record_request(prompt: PromptValue):
+        instrumentation = get_instrumentation()
+        if instrumentation.enabled:
+            instrumentation.count("llm_requests")
+            instrumentation.count("llm_bytes_sent", len(prompt.to_string().encode("utf-8")))
 
+    @staticmethod
+    def _parse_message(message: BaseMessage, parser: JsonOutputParser) -> dict:
+        instrumentation = get_instrumentation()
+        usage = getattr(message, "usage_metadata", None)
+        if instrumentation.enabled and usage:
+            instrumentation.count("llm_input_tokens", usage.get("input_tokens", 0))
+            instrumentation.count("llm_output_tokens", usage.get("output_tokens", 0))
+        with instrumentation.timer("parsing"):
+            return parser.invoke(message)
+
+    def _invoke(self, chain_input: dict, prompt_template: Optional[PromptTemplate] = None,
+                parser: Optional[JsonOutputParser] = None) -> dict:
+        """
+        Run prompt, model and parser, retrying the model with exponential backoff while the provider
+        reports a rate limit. The steps run separately (rather than as one chain) so each can be measured.
+        Uses the single-item prompt and parser unless others are given.
+        """
+        prompt = (prompt_template or self.prompt_template).invoke(chain_input)
+        for attempt in range(self.max_retries + 1):
+            self._record_request(prompt)
+            try:
+                with get_instrumentation().timer("llm"):
+                    message = self.model.invoke(prompt)
+                break
+            except Exception as e:
+                if attempt == self.max_retries or not _is_rate_limit_error(e):
+                    raise
+                time.sleep(self.retry_backoff * 2 ** attempt)
+        return self._parse_message(message, parser or self.parser)
+
+    async def _ainvoke(self, chain_input: dict) -> dict:
+        prompt = self.prompt_template.invoke(chain_input)
+        for attempt in range(self.max_retries + 1):
+            self._record_request(prompt)
+            try:
+                with get_instrumentation().timer("llm"):
+                    message = await self.model.ainvoke(prompt)
+                break
+            except Exception as e:
+                if attempt == self.max_retries or not _is_rate_limit_error(e):
+                    raise
+                await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+        return self._parse_message(message, self.parser)
+
+    def classify(
+            self, line_item: str, candidates: List[Category], query: Optional[Any] = None
+    ) -> Tuple[Category, float, Optional[str]]:
+        key, cached = self._cached(line_item, candidates)
+        if cached is not None:
+            return cached
+        return self._classify_uncached(line_item, candidates, key)
+
+    def _classify_uncached(
+            self, line_item: str, candidates: List[Category], key: Optional[str]
+    ) -> Tuple[Category, float, Optional[str]]:
+        chain_input = dict(line_item=line_item, candidates_text=self._candidates_text(candidates))
         try:
-            chain = self.prompt_template | self.model | self.parser
-            response = chain.invoke(input=dict(line_item=line_item,
-                                               candidates_text=candidates_text))
+            result = self._parse_response(self._invoke(chain_input), candidates)
+        except Exception as e:
+            # Fallbacks are never cached.
+            return self._fallback(candidates, e)
+        self._store(key, result)
+        return result
+
+    async def aclassify(
+            self, line_item: str, candidates: List[Category], query: Optional[Any] = None
+    ) -> Tuple[Category, float, Optional[str]]:
+        key, cached = self._cached(line_item, candidates)
+        if cached is not None:
+            return cached
+
+        chain_input = dict(line_item=line_item, candidates_text=self._candidates_text(candidates))
+        try:
+            result = self._parse_response(await self._ainvoke(chain_input), candidates)
+        except Exception as e:
+            # Fallbacks are never cached.
+            return self._fallback(candidates, e)
+        self._store(key, result)
+        return result
 
-            selected_index = response.get("selected_index")
-            confidence = response.get("confidence")
-            warning = response.get("warning")
+    def classify_group(
+            self, line_items: List[str], candidates: List[Category], queries: List[Any]
+    ) -> List[Tuple[Category, float, Optional[str]]]:
+        """
+        With `items_per_request` > 1, classify the line items in requests of up to that many items.
+        Cached decisions are used as usual, and repeated line items are sent only once.
+        """
+        if self.items_per_request <= 1:
+            return super().classify_group(line_items, candidates, queries)
 
-            if not (isinstance(selected_index, int) and 0 <= selected_index <= len(candidates)):
-                raise ValueError("Invalid selected_index returned by the LLM.")
+        results: List[Optional[Tuple[Category, float, Optional[str]]]] = [None] * len(line_items)
+        # Cache key and positions of every distinct line item that is not cached.
+        pending: Dict[str, Tuple[Optional[str], List[int]]] = {}
+        for i, line_item in enumerate(line_items):
+            if line_item in pending:
+                pending[line_item][1].append(i)
+                continue
+            key, cached = self._cached(line_item, candidates)
+            if cached is not None:
+                results[i] = cached
+            else:
+                pending[line_item] = (key, [i])
 
-            selected_candidate = candidates[selected_index]
-            return selected_candidate, confidence, warning if warning else None
+        unique_items = list(pending)
+        candidates_text = self._candidates_text(candidates)
+        for start in range(0, len(unique_items), self.items_per_request):
+            chunk = unique_items[start:start + self.items_per_request]
+            # What the chunk would cost in per-item requests; the requests actually sent for it are
+            # charged by `_classify_chunk`.
+            self._record_batch_tokens(0, sum(self._per_item_tokens(line_item, candidates_text) for line_item in chunk),
+                                      len(chunk))
+            chunk_results = self._classify_chunk(chunk, [pending[line_item][0] for line_item in chunk],
+                                                 candidates, candidates_text)
+            for line_item, result in zip(chunk, chunk_results):
+                for i in pending[line_item][1]:
+                    results[i] = result
+        return results
+
+    def _classify_chunk(
+            self, line_items: List[str], keys: List[Optional[str]], candidates: List[Category],
+            candidates_text: str
+    ) -> List[Tuple[Category, float, Optional[str]]]:
+        """
+        Classify line items with one batched request. If the response cannot be parsed at all, the
+        chunk is split in halves which are retried; line items missing from an otherwise valid
+        response, or with an invalid answer, are retried one by one with the single-item prompt.
+        Any other error (e.g. the connection, or a rate limit outlasting the retries) is not retried
+        and makes the whole chunk fall back. Every request sent is charged to the batched prompt tokens.
+        """
+        if len(line_items) == 1:
+            self._record_batch_tokens(self._per_item_tokens(line_items[0], candidates_text), 0, 0)
+            return [self._classify_uncached(line_items[0], candidates, keys[0])]
 
+        chain_input = dict(line_items_text=self._line_items_text(line_items), candidates_text=candidates_text)
+        # Paid for whatever the outcome, as the response may be malformed or the request may fail.
+        self._record_batch_tokens(_estimate_tokens(self.batch_prompt_template.format(**chain_input)), 0, 0)
+        try:
+            response = self._invoke(chain_input, self.batch_prompt_template, self.batch_parser)
+            answers = response["results"]
+            if not isinstance(answers, list):
+                raise ValueError("The LLM did not return a list of results.")
+        except (OutputParserException, KeyError, TypeError, ValueError) as e:
+            print(f"Malformed batched LLM response: {e}. Splitting {len(line_items)} line items.")
+            get_instrumentation().count("llm_batch_splits")
+            middle = len(line_items) // 2
+            return (self._classify_chunk(line_items[:middle], keys[:middle], candidates, candidates_text)
+                    + self._classify_chunk(line_items[middle:], keys[middle:], candidates, candidates_text))
         except Exception as e:
-            # Fallback in case of error
-            print(f"Error during LangChain classification: {e}. Falling back to default candidate.")
-            return candidates[0], 0.5, "Fallback due to error."
+            # Fallbacks are never cached.
+            return [self._fallback(candidates, e) for _ in line_items]
+
+        parsed = {}
+        for answer in answers:
+            try:
+                position = answer["item_number"] - 1
+                if 0 <= position < len(line_items):
+                    parsed.setdefault(position, self._parse_response(answer, candidates))
+            except Exception:
+                continue
+        if len(parsed) < len(line_items):
+            get_instrumentation().count("llm_batch_item_retries", len(line_items) - len(parsed))
+        results = []
+        for i, (line_item, key) in enumerate(zip(line_items, keys)):
+            if i in parsed:
+                self._store(key, parsed[i])
+                results.append(parsed[i])
+            else:
+                # Sent again with the single-item prompt, a cost of batching on top of the batch.
+                self._record_batch_tokens(self._per_item_tokens(line_item, candidates_text), 0, 0)
+                results.append(self._classify_uncached(line_item, candidates, key))
+        return results
+
+    def _per_item_tokens(self, line_item: str, candidates_text: str) -> int:
+        return _estimate_tokens(self.prompt_template.format(line_item=line_item, candidates_text=candidates_text))
+
+    def _record_batch_tokens(self, batched_tokens: int, per_item_tokens: int, items: int):
+        self.batched_items += items
+        self.batched_prompt_tokens += batched_tokens
+        self.per_item_prompt_tokens += per_item_tokens
+        instrumentation = get_instrumentation()
+        instrumentation.count("llm_batched_items", items)
+        instrumentation.count("llm_prompt_tokens_saved", per_item_tokens - batched_tokens)
+
+    def batch_savings(self) -> Dict[str, float]:
+        """
+        Estimated prompt tokens (about 4 characters each) of all requests sent for line items
+        classified in batches so far, against what the same line items would have cost in per-item
+        requests. Batched requests count whatever their outcome (malformed, failed or answered), as
+        do the single-item requests after a chunk is split down to one line item and the retries of
+        line items missing from a response. Every line item is counted once.
+        """
+        saved = self.per_item_prompt_tokens - self.batched_prompt_tokens
+        return {"batched_items": self.batched_items,
+                "batched_prompt_tokens": self.batched_prompt_tokens,
+                "per_item_prompt_tokens": self.per_item_prompt_tokens,
+                "tokens_saved_per_item": saved / self.batched_items if self.batched_items else 0.0}
+
+
+class FullPathLLMClassifier(LangChainLLMClassifier):
+    """
+    Classifies a line item with a single LLM call, whatever the depth of the hierarchy.
+
+    The hierarchy is flattened into root-to-leaf paths, which are embedded once. For each line item
+    the `k` paths most similar to it are retrieved and the LLM is asked once to choose among them,
+    so the prompt size is bounded by `k` rather than by the width of the tree.
+
+    The chosen path is the query representation returned by `encode`, so `recursive_classify` and
+    `classify_batch` just read the decision for every level from it.
+    """
+
+    def __init__(self, root: Category, embeddings: Embeddings, k: int = 10, batch_size: int = 512, **kwargs):
+        """
+        Parameters:
+          - root: the root of the hierarchy (it is not part of the returned paths).
+          - embeddings: embedding model used for the paths and line items.
+          - k: number of candidate paths shown to the LLM.
+          - batch_size: number of paths embedded per call when building the path index.
+          - kwargs: passed to LangChainLLMClassifier.
+        """
+        super().__init__(**kwargs)
+        self.root = root
+        self.embeddings = embeddings
+        self.k = k
+
+        # Flatten the hierarchy into its root-to-leaf paths.
+        self.paths: List[List[Category]] = []
+        stack = [(child, []) for child in reversed(root.children)]
+        while stack:
+            category, parent_path = stack.pop()
+            path = parent_path + [category]
+            if category.children:
+                stack.extend((child, path) for child in reversed(category.children))
+            else:
+                self.paths.append(path)
+        self._path_of_leaf = {id(path[-1]): path for path in self.paths}
+
+        texts = [self._path_text(path) for path in self.paths]
+        vectors = []
+        for start in range(0, len(texts), batch_size):
+            vectors.extend(embeddings.embed_documents(texts[start:start + batch_size]))
+        self.path_vectors = normalize_rows(np.asarray(vectors, dtype=np.float32))
+
+    def _make_prompt_template(self) -> PromptTemplate:
+        return PromptTemplate(
+            input_variables=["line_item", "candidates_text"],
+
+            template=(
+                "You are a classification expert. Given the following invoice line item:\n\n"
+                "Line item: \"{line_item}\"\n\n"
+                "And the following candidate category paths (from the top level down to the most specific "
+                "category):\n"
+                "{candidates_text}\n\n"
+                "Please select the candidate path that best matches the invoice line item.\n"
+                "{format_instructions}"
+            ),
+            partial_variables={"format_instructions": self.parser.get_format_instructions()},
+        )
+
+    @staticmethod
+    def _path_text(path: List[Category]) -> str:
+        leaf = path[-1]
+        return (
+            f"Category Path: {' > '.join(category.name for category in path)}\n"
+            f"Code: {leaf.code}\n"
+            f"Description: {leaf.description}"
+        )
+
+    def _candidates_text(self, candidates: List[Category]) -> str:
+        # Candidates are leaves; show each with its full path.
+        candidate_lines = []
+        for idx, leaf in enumerate(candidates, start=1):
+            path = self._path_of_leaf[id(leaf)]
+            desc = leaf.description if leaf.description else leaf.name
+            candidate_lines.append(f"{idx}. Code: {leaf.code}, "
+                                   f"Name: {' > '.join(category.name for category in path)}, Description: {desc}")
+        return "\n".join(candidate_lines)
+
+    def _decision_code(self, candidate: Category) -> str:
+        # Leaf codes repeat across paths (e.g. the many "Standard" leaves), so use the full path of codes.
+        return json.dumps([category.code for category in self._path_of_leaf[id(candidate)]])
+
+    def _top_leaves(self, query_vector: List[float]) -> List[Category]:
+        """
+        Leaves of the `k` paths most similar to the query, most similar first.
+        """
+        scores = self.path_vectors @ normalize_rows(np.asarray(query_vector, dtype=np.float32))
+        k = min(self.k, len(self.paths))
+        top_rows = np.argpartition(-scores, k - 1)[:k]
+        top_rows = top_rows[np.argsort(-scores[top_rows])]
+        return [self.paths[row][-1] for row in top_rows.tolist()]
+
+    def _as_path(self, result: Tuple[Category, float, Optional[str]]) -> List[Tuple[Category, float, Optional[str]]]:
+        leaf, confidence, warning = result
+        return [(category, confidence, warning) for category in self._path_of_leaf[id(leaf)]]
+
+    def encode(self, line_item: str) -> List[Tuple[Category, float, Optional[str]]]:
+        """
+        Choose the full classification path of the line item with one LLM call.
+        """
+        with embedding_request([line_item]):
+            query_vector = self.embeddings.embed_query(line_item)
+        return self._as_path(super().classify(line_item, self._top_leaves(query_vector)))
+
+    async def aencode(self, line_item: str) -> List[Tuple[Category, float, Optional[str]]]:
+        with embedding_request([line_item]):
+            query_vector = await self.embeddings.aembed_query(line_item)
+        return self._as_path(await super().aclassify(line_item, self._top_leaves(query_vector)))
+
+    def encode_batch(self, line_items: List[str]) -> List[List[Tuple[Category, float, Optional[str]]]]:
+        # One embedding call for the batch, then one LLM call per line item.
+        with embedding_request(line_items):
+            query_vectors = self.embeddings.embed_documents(line_items)
+        return [self._as_path(super(FullPathLLMClassifier, self).classify(line_item, self._top_leaves(query_vector)))
+                for line_item, query_vector in zip(line_items, query_vectors)]
+
+    def classify(
+            self, line_item: str, candidates: List[Category],
+            query: Optional[List[Tuple[Category, float, Optional[str]]]] = None
+    ) -> Tuple[Category, float, Optional[str]]:
+        if query is None:
+            query = self.encode(line_item)
+        candidate_ids = {id(candidate) for candidate in candidates}
+        for result in query:
+            if id(result[0]) in candidate_ids:
+                return result
+        return candidates[0], 0.0, "The chosen path does not pass through any of the candidates."
+
+    async def aclassify(
+            self, line_item: str, candidates: List[Category],
+            query: Optional[List[Tuple[Category, float, Optional[str]]]] = None
+    ) -> Tuple[Category, float, Optional[str]]:
+        if query is None:
+            query = await self.aencode(line_item)
+        return self.classify(line_item, candidates, query=query)
+
+    def classify_group(
+            self, line_items: List[str], candidates: List[Category],
+            queries: List[List[Tuple[Category, float, Optional[str]]]]
+    ) -> List[Tuple[Category, float, Optional[str]]]:
+        # The decisions were made in `encode`; only read them from the queries.
+        return BaseClassifier.classify_group(self, line_items, candidates, queries)
+
+
+class CascadeClassifier(BaseClassifier):
+    """
+    Decides with a cheap scoring classifier (e.g. VectorClassifier or HierarchyVectorIndex) and
+    escalates to an expensive one (e.g. LangChainLLMClassifier) only when the decision is ambiguous.
+
+    At every level all candidates are scored; if the margin between the best and the second best
+    score is below `margin_threshold`, the level is handed to the expensive classifier. Otherwise
+    the confidence is the softmax probability of the best candidate at the given `temperature`.
+    Per-level escalation rates are tracked to tune the threshold (cost against accuracy).
+    """
+
+    def __init__(self, scoring_classifier: BaseClassifier, escalation_classifier: BaseClassifier,
+                 margin_threshold: float = 0.05, temperature: float = 0.05):
+        self.scoring_classifier = scoring_classifier
+        self.escalation_classifier = escalation_classifier
+        self.margin_threshold = margin_threshold
+        self.temperature = temperature
+        # Per level: number of decisions made and how many of them were escalated.
+        self.decisions: Dict[int, int] = defaultdict(int)
+        self.escalations: Dict[int, int] = defaultdict(int)
+
+    def encode(self, line_item: str) -> Any:
+        return self.scoring_classifier.encode(line_item)
+
+    async def aencode(self, line_item: str) -> Any:
+        return await self.scoring_classifier.aencode(line_item)
+
+    def encode_batch(self, line_items: List[str]) -> List[Any]:
+        return self.scoring_classifier.encode_batch(line_items)
+
+    def _decide(self, scores: np.ndarray, candidates: List[Category]) -> Optional[Tuple[Category, float, Optional[str]]]:
+        """
+        Decision from the scores, or None if it has to be escalated.
+        """
+        level = candidates[0].level
+        self.decisions[level] += 1
+        best, margin, confidence = _margin_decision(scores, self.temperature)
+        if not margin >= self.margin_threshold:
+            self.escalations[level] += 1
+            get_instrumentation().count("escalations", level=level)
+            return None
+        return candidates[best], confidence, ""
+
+    def classify(
+            self, line_item: str, candidates: List[Category], query: Optional[Any] = None
+    ) -> Tuple[Category, float, Optional[str]]:
+        try:
+            result = self._decide(self.scoring_classifier.score(line_item, candidates, query), candidates)
+        except Exception as e:
+            print(f"Error while scoring candidates: {e}. Escalating.")
+            self.decisions[candidates[0].level] += 1
+            self.escalations[candidates[0].level] += 1
+            get_instrumentation().count("escalations", level=candidates[0].level)
+            result = None
+        return result if result is not None else self.escalation_classifier.classify(line_item, candidates)
+
+    def classify_group(
+            self, line_items: List[str], candidates: List[Category], queries: List[Any]
+    ) -> List[Tuple[Category, float, Optional[str]]]:
+        try:
+            scores = self.scoring_classifier.score_group(line_items, candidates, queries)
+        except Exception as e:
+            print(f"Error while scoring candidates: {e}. Escalating.")
+            return [self.classify(line_item, candidates, query) for line_item, query in zip(line_items, queries)]
+
+        results = [self._decide(item_scores, candidates) for item_scores in scores]
+        escalated = [i for i, result in enumerate(results) if result is None]
+        if escalated:
+            escalated_results = self.escalation_classifier.classify_group(
+                [line_items[i] for i in escalated], candidates, [None] * len(escalated))
+            for i, result in zip(escalated, escalated_results):
+                results[i] = result
+        return results
+
+    def escalation_rates(self) -> Dict[int, float]:
+        """
+        Share of decisions escalated to the expensive classifier, per level.
+        """
+        return {level: self.escalations[level] / count for level, count in sorted(self.decisions.items())}
+
+
+def _margin_decisions(scores: np.ndarray, temperature: float) -> Tuple[List[int], np.ndarray, List[float]]:
+    """
+    For every row of a score matrix: the best candidate, the margin of its score over the second best
+    (infinite with one candidate) and its softmax probability at the given temperature.
+    """
+    rows = np.arange(len(scores))
+    # argmax breaks ties towards the first candidate, like the other scoring classifiers.
+    best = scores.argmax(axis=1)
+    best_scores = scores[rows, best]
+    if scores.shape[1] > 1:
+        margins = best_scores - np.partition(scores, -2, axis=1)[:, -2]
+    else:
+        margins = np.full(len(scores), np.inf)
+    probabilities = np.exp((scores - best_scores[:, None]) / temperature)
+    return best.tolist(), margins, (probabilities[rows, best] / probabilities.sum(axis=1)).tolist()
+
+
+def _margin_decision(scores: np.ndarray, temperature: float) -> Tuple[int, float, float]:
+    """
+    `_margin_decisions` of a single row of scores.
+    """
+    best, margins, confidences = _margin_decisions(scores[None, :], temperature)
+    return best[0], float(margins[0]), confidences[0]
+
+
+def decide_by_margin(
+        scores: np.ndarray, candidates: List[Category], margin: float, temperature: float
+) -> Tuple[Category, float, Optional[str]]:
+    """
+    Decision of a scoring classifier: the best candidate, its softmax probability as confidence,
+    and a warning if another candidate scores within `margin` of it.
+    """
+    best, score_margin, confidence = _margin_decision(scores, temperature)
+    return candidates[best], confidence, _margin_warning(score_margin < margin)
+
+
+def _margin_warning(ambiguous: bool) -> str:
+    return "Multiple candidates have similar similarity scores. Manual review recommended." if ambiguous else ""
+
+
+def _estimate_tokens(text: str) -> int:
+    # Rough token count of English text (about 4 characters per token), model independent.
+    return len(text) // 4
+
+
+def _is_rate_limit_error(e: Exception) -> bool:
+    return isinstance(e, openai.RateLimitError) or getattr(e, "status_code", None) == 429
 
 
 def recursive_classify(
-        line_item: str, category: Category, classifier: BaseClassifier
+        line_item: str, category: Category, classifier: BaseClassifier, query: Optional[Any] = None
 ) -> List[Tuple[Category, float, Optional[str]]]:
     """
     Recursively classify the invoice line item by traversing the category tree.
     Returns a list of tuples (Category, confidence, warning) representing the classification path.
+
+    The query representation is computed once by `classifier.encode` and passed down to every level,
+    so e.g. the line item is embedded only once per classification instead of once per level.
     """
     classification_path = []
     # If the current category has children, perform classification among them.
     if category.children:
-        selected_category, confidence, warning = classifier.classify(line_item, category.children)
+        instrumentation = get_instrumentation()
+        if query is None:
+            with instrumentation.timer("encode"):
+                query = classifier.encode(line_item)
+        with instrumentation.timer("level", level=category.children[0].level):
+            selected_category, confidence, warning = classifier.classify(line_item, category.children, query=query)
         classification_path.append((selected_category, confidence, warning))
         # Continue recursively down the tree.
-        classification_path.extend(recursive_classify(line_item, selected_category, classifier))
+        classification_path.extend(recursive_classify(line_item, selected_category, classifier, query=query))
     return classification_path
+
+
+async def arecursive_classify(
+        line_item: str, category: Category, classifier: BaseClassifier, query: Optional[Any] = None
+) -> List[Tuple[Category, float, Optional[str]]]:
+    """
+    Async variant of `recursive_classify`, using `classifier.aclassify` at every level.
+    """
+    classification_path = []
+    instrumentation = get_instrumentation()
+    if query is None and category.children:
+        with instrumentation.timer("encode"):
+            query = await classifier.aencode(line_item)
+    while category.children:
+        with instrumentation.timer("level", level=category.children[0].level):
+            selected_category, confidence, warning = await classifier.aclassify(line_item, category.children,
+                                                                                query=query)
+        classification_path.append((selected_category, confidence, warning))
+        category = selected_category
+    return classification_path
+
+
+async def aclassify_many(
+        line_items: List[str], root: Category, classifier: BaseClassifier, max_concurrency: int = 8
+) -> List[List[Tuple[Category, float, Optional[str]]]]:
+    """
+    Classify many line items concurrently, with at most `max_concurrency` of them in flight at once.
+    Returns one classification path per line item, in input order.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def classify_one(line_item: str):
+        async with semaphore:
+            return await arecursive_classify(line_item, root, classifier)
+
+    return list(await asyncio.gather(*(classify_one(line_item) for line_item in line_items)))
+
+
+def classify_many(
+        line_items: List[str], root: Category, classifier: BaseClassifier, max_concurrency: int = 8
+) -> List[List[Tuple[Category, float, Optional[str]]]]:
+    """
+    Blocking entry point for `aclassify_many`.
+    """
+    return asyncio.run(aclassify_many(line_items, root, classifier, max_concurrency=max_concurrency))
+
+
+def classify_batch(
+        line_items: List[str], root: Category, classifier: BaseClassifier
+) -> List[List[Tuple[Category, float, Optional[str]]]]:
+    """
+    Classify many invoice line items at once by walking the category tree level by level.
+
+    All line items are encoded with a single `classifier.encode_batch` call. At every level the items
+    are grouped by the node they currently sit at, and each group is classified with one
+    `classifier.classify_group` call among that node's children.
+    Returns one classification path per line item, in the same format as `recursive_classify`.
+    """
+    classification_paths = [[] for _ in line_items]
+    if not (line_items and root.children):
+        return classification_paths
+    instrumentation = get_instrumentation()
+    with instrumentation.timer("encode_batch"):
+        queries = classifier.encode_batch(line_items)
+
+    # Nodes still to be decided, keyed by id() as pydantic models are not hashable.
+    frontier = {id(root): (root, list(range(len(line_items))))}
+    while frontier:
+        next_frontier = {}
+        for parent, item_indices in frontier.values():
+            with instrumentation.timer("level", level=parent.children[0].level):
+                results = classifier.classify_group([line_items[i] for i in item_indices],
+                                                    parent.children,
+                                                    [queries[i] for i in item_indices])
+            for i, result in zip(item_indices, results):
+                classification_paths[i].append(result)
+                selected_category = result[0]
+                if selected_category.children:
+                    next_frontier.setdefault(id(selected_category), (selected_category, []))[1].append(i)
+        frontier = next_frontier
+    return classification_paths
+
+
+def _log_softmax(scores: np.ndarray) -> np.ndarray:
+    shifted = scores - scores.max(axis=1, keepdims=True)
+    return shifted - np.log(np.exp(shifted).sum(axis=1, keepdims=True))
+
+
+def beam_classify_batch(
+        line_items: List[str], root: Category, classifier: BaseClassifier, beam_width: int = 3,
+        n_best: Optional[int] = None, temperature: float = 0.05, margin: Optional[float] = None
+) -> List[List[Tuple[List[Tuple[Category, float, Optional[str]]], float]]]:
+    """
+    Beam search down the category tree: instead of following only the best child at every level,
+    keep the `beam_width` partial paths with the highest cumulative score per line item.
+
+    At every level the candidates are scored with `classifier.score_group` (so the classifier must
+    rank candidates by a score, e.g. HierarchyVectorIndex, VectorClassifier or LexicalClassifier) and
+    turned into probabilities by a softmax at the given `temperature`. A path scores as the sum of
+    its log-probabilities. As in `classify_batch`, all beam entries of the batch waiting at the same
+    node are scored in one call, so per level there is at most one call per distinct node in the
+    beams, and `beam_width=1` makes exactly the calls of the greedy walk.
+
+    Returns, per line item, the `n_best` (default: `beam_width`) complete paths, best first, as
+    (classification path, cumulative log-probability); each step of a path carries the probability
+    of its category among its siblings as confidence, and the warning of `decide_by_margin` if the
+    best two siblings score within `margin` (default: the classifier's margin) of each other.
+    Where scoring fails or no sibling gets a score, the path falls back to the last candidate with
+    confidence 0, as in `classify_batch`.
+    """
+    n_best = beam_width if n_best is None else min(n_best, beam_width)
+    margin = getattr(classifier, "margin", 0.05) if margin is None else margin
+    if not (line_items and root.children):
+        return [[([], 0.0)] for _ in line_items]
+    instrumentation = get_instrumentation()
+    with instrumentation.timer("encode_batch"):
+        queries = classifier.encode_batch(line_items)
+
+    # Beam of every line item: (cumulative log-probability, path, node the path ends at).
+    beams = [[(0.0, [], root)] for _ in line_items]
+    while True:
+        # Beam entries still to be expanded, grouped by node (keyed by id(), see classify_batch).
+        groups = {}
+        next_beams = []
+        for i, beam in enumerate(beams):
+            next_beams.append([entry for entry in beam if not entry[2].children])
+            for entry in beam:
+                if entry[2].children:
+                    groups.setdefault(id(entry[2]), (entry[2], []))[1].append((i, entry))
+        if not groups:
+            break
+
+        for node, members in groups.values():
+            with instrumentation.timer("level", level=node.children[0].level):
+                try:
+                    scores = np.asarray(classifier.score_group([line_items[i] for i, _ in members], node.children,
+                                                               [queries[i] for i, _ in members]), dtype=np.float64)
+                    error = None
+                except Exception as e:
+                    scores, error = np.full((len(members), len(node.children)), -np.inf), str(e)
+            scored = np.isfinite(scores).any(axis=1)
+            # Rows without any score get a dummy softmax; they take the fallback below.
+            log_probabilities = _log_softmax(np.where(scored[:, None], scores, 0.0) / temperature)
+            # Only the best `beam_width` children of an entry can make it into the beam.
+            top_children = np.argsort(-log_probabilities, axis=1, kind="stable")[:, :beam_width]
+            for (i, (score, path, _)), item_scores, row, children, is_scored in zip(
+                    members, scores, log_probabilities, top_children.tolist(), scored.tolist()):
+                if not is_scored:
+                    # As in classify_batch: the last candidate with confidence 0. It counts as one of
+                    # equally likely children, so the path score stays finite.
+                    instrumentation.count("fallbacks")
+                    child = node.children[-1]
+                    warning = error or getattr(classifier, "unscored_warning", ScoringClassifier.unscored_warning)
+                    next_beams[i].append((score - np.log(len(node.children)), path + [(child, 0.0, warning)], child))
+                    continue
+                # The decision at this node is as ambiguous for every child the entry expands into.
+                warning = _margin_warning(_margin_decision(item_scores, temperature)[1] < margin)
+                for c in children:
+                    if np.isfinite(row[c]):
+                        # Children without a score (e.g. missing from the vector store) are not expanded.
+                        child = node.children[c]
+                        next_beams[i].append((score + row[c], path + [(child, float(np.exp(row[c])), warning)], child))
+        # Stable sort: on equal scores the earlier child wins, as with argmax in the greedy walk.
+        beams = [sorted(beam, key=lambda entry: -entry[0])[:beam_width] for beam in next_beams]
+
+    return [[(path, float(score)) for score, path, _ in beam[:n_best]] for beam in beams]
+
+
+def beam_classify(
+        line_item: str, root: Category, classifier: BaseClassifier, beam_width: int = 3,
+        n_best: Optional[int] = None, temperature: float = 0.05, margin: Optional[float] = None
+) -> List[Tuple[List[Tuple[Category, float, Optional[str]]], float]]:
+    """
+    `beam_classify_batch` for a single line item: its n-best classification paths with their scores.
+    """
+    return beam_classify_batch([line_item], root, classifier, beam_width=beam_width, n_best=n_best,
+                               temperature=temperature, margin=margin)[0]
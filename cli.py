@@ -0,0 +1,237 @@
+"""
+Command line entry point for bulk classification of invoice line items.
+
+    python cli.py classify invoices.csv results.csv --column description --classifier index
+
+The input (CSV or Parquet) is streamed in chunks of --chunk-size rows. Every chunk is classified
+and appended to the output CSV, then a checkpoint is written next to the output. If the run is
+interrupted, running the same command again resumes after the last completed chunk.
+
+    python cli.py import-confirmed reviewed.csv confirmed.sqlite
+    python cli.py classify invoices.csv results.csv --confirmed confirmed.sqlite
+
+Line items matching a confirmed classification (exactly or nearly) take the confirmed path
+without calling the classifier.
+"""
+import argparse
+import json
+import os
+import time
+from typing import List, Optional, Tuple
+
+import pandas as pd
+from dotenv import load_dotenv
+
+from Category import Category
+from classifiers import (BaseClassifier, FullPathLLMClassifier, LangChainLLMClassifier, VectorClassifier,
+                         beam_classify_batch, classify_batch)
+from excel_loaders import load_hierarchy_from_table, read_table_in_chunks
+from confirmed_store import ConfirmedStore, classify_batch_with_confirmed
+from fakes import FakeLatencyChatModel, FakeLatencyEmbeddings
+from hierarchy_index import HierarchyVectorIndex
+from lexical_classifier import LexicalClassifier
+from test.hierarchy_build import build_full_hierarchy
+from vector_embedding import get_vector_store, sync_hierarchy_into_chroma
+
+CLASSIFIERS = ("index", "vector", "llm", "fullpath", "lexical")
+
+
+def load_root(hierarchy_file: Optional[str]) -> Category:
+    """
+    Root of the hierarchy in the given file, or the demo hierarchy if no file is given.
+    """
+    if hierarchy_file is None:
+        return build_full_hierarchy()
+    roots = load_hierarchy_from_table(hierarchy_file)
+    if len(roots) == 1:
+        return roots[0]
+    root = Category(code="root", name="All Categories", level=0, description="Root category for all classifications")
+    for category in roots:
+        root.add_child(category)
+    return root
+
+
+def build_classifier(name: str, root: Category, args: argparse.Namespace) -> BaseClassifier:
+    if name == "lexical":
+        # Needs no model at all.
+        return LexicalClassifier(root)
+    if args.fake:
+        embeddings, model = FakeLatencyEmbeddings(), FakeLatencyChatModel()
+    else:
+        from embedding_cache import CachedEmbeddings
+        from langchain_openai import OpenAIEmbeddings
+        embeddings, model = CachedEmbeddings(OpenAIEmbeddings(model="text-embedding-3-large")), None
+
+    if name == "index":
+        if HierarchyVectorIndex.matches(args.index_dir, root, embeddings):
+            return HierarchyVectorIndex.load(args.index_dir, embeddings)
+        if os.path.exists(os.path.join(args.index_dir, "vectors.npy")):
+            print(f"The index in {args.index_dir} was built from another hierarchy or embedding model; rebuilding.")
+        index = HierarchyVectorIndex.build(root, embeddings)
+        index.save(args.index_dir)
+        return index
+    if name == "vector":
+        vectorstore = get_vector_store(persist_directory=args.persist_directory, embeddings=embeddings)
+        sync_hierarchy_into_chroma(vectorstore, root)
+        return VectorClassifier(vectorstore=vectorstore)
+    if name == "llm":
+        return LangChainLLMClassifier(model_name=args.model, model=model, items_per_request=args.items_per_request)
+    return FullPathLLMClassifier(root, embeddings, model_name=args.model, model=model)
+
+
+def result_row(line_item: str, path: List[Tuple[Category, float, Optional[str]]],
+               alternatives: Optional[List[Tuple[List[Tuple[Category, float, Optional[str]]], float]]] = None) -> dict:
+    row = {
+        "line_item": line_item,
+        "path_codes": json.dumps([category.code for category, _, _ in path]),
+        "path_names": json.dumps([category.name for category, _, _ in path]),
+        "confidences": json.dumps([confidence for _, confidence, _ in path]),
+        "warnings": json.dumps([warning or "" for _, _, warning in path]),
+    }
+    if alternatives is not None:
+        # Ranked paths of a beam search, the first being `path` itself.
+        row["alternatives"] = json.dumps([{"path_codes": [category.code for category, _, _ in alternative],
+                                           "score": score} for alternative, score in alternatives])
+    return row
+
+
+def run_settings(args: argparse.Namespace) -> dict:
+    """
+    Options of a classify run that change its output; a run is only resumed with the same ones.
+    """
+    return {"column": args.column, "classifier": args.classifier,
+            "hierarchy": os.path.abspath(args.hierarchy) if args.hierarchy else None,
+            "model": args.model, "fake": args.fake, "items_per_request": args.items_per_request,
+            "confirmed": os.path.abspath(args.confirmed) if args.confirmed else None, "n_best": args.n_best}
+
+
+def read_checkpoint(checkpoint_path: str, input_path: str, settings: dict) -> Tuple[int, int]:
+    """
+    Number of input rows already classified and size of the output file after them.
+    """
+    if not os.path.exists(checkpoint_path):
+        return 0, 0
+    with open(checkpoint_path) as f:
+        checkpoint = json.load(f)
+    if checkpoint["input"] != os.path.abspath(input_path):
+        raise ValueError(f"Checkpoint {checkpoint_path} belongs to {checkpoint['input']}, not {input_path}.")
+    if checkpoint.get("settings") != settings:
+        raise ValueError(f"Checkpoint {checkpoint_path} was written with other options "
+                         f"({checkpoint.get('settings')}); rerun with them or use --restart.")
+    return checkpoint["rows_done"], checkpoint["output_bytes"]
+
+
+def write_checkpoint(checkpoint_path: str, input_path: str, settings: dict, rows_done: int, output_bytes: int):
+    # Write to a temporary file and rename, so a crash never leaves a half-written checkpoint.
+    temporary_path = checkpoint_path + ".tmp"
+    with open(temporary_path, "w") as f:
+        json.dump({"input": os.path.abspath(input_path), "settings": settings, "rows_done": rows_done,
+                   "output_bytes": output_bytes}, f)
+    os.replace(temporary_path, checkpoint_path)
+
+
+def classify_file(args: argparse.Namespace):
+    checkpoint_path = args.checkpoint or args.output + ".checkpoint.json"
+    if args.restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    settings = run_settings(args)
+    resuming = os.path.exists(checkpoint_path)
+    if not resuming and os.path.exists(args.output) and not args.restart:
+        raise ValueError(f"{args.output} exists but has no checkpoint; use --restart to overwrite it.")
+    rows_done, output_bytes = read_checkpoint(checkpoint_path, args.input, settings)
+    if rows_done:
+        print(f"Resuming after {rows_done} rows.")
+
+    root = load_root(args.hierarchy)
+    classifier = build_classifier(args.classifier, root, args)
+    store = ConfirmedStore(args.confirmed) if args.confirmed else None
+
+    # Drop output written after the last checkpoint (e.g. by a chunk that was interrupted), or
+    # all of it when restarting.
+    if resuming or args.restart:
+        with open(args.output, "a+b") as output:
+            output.truncate(output_bytes)
+
+    start = time.perf_counter()
+    rows_at_start = rows_done
+    for chunk in read_table_in_chunks(args.input, args.chunk_size, skip_rows=rows_done):
+        line_items = chunk[args.column].fillna("").astype(str).tolist()
+        ranked = [None] * len(line_items)
+        if args.n_best > 1:
+            ranked = beam_classify_batch(line_items, root, classifier, beam_width=args.n_best)
+            paths = [alternatives[0][0] for alternatives in ranked]
+        elif store is not None:
+            paths = classify_batch_with_confirmed(line_items, root, classifier, store)
+        else:
+            paths = classify_batch(line_items, root, classifier)
+        results = pd.DataFrame([result_row(line_item, path, alternatives)
+                                for line_item, path, alternatives in zip(line_items, paths, ranked)])
+
+        with open(args.output, "a", newline="", encoding="utf-8") as output:
+            results.to_csv(output, header=output.tell() == 0, index=False)
+            output.flush()
+            os.fsync(output.fileno())
+            output_bytes = output.tell()
+        rows_done += len(line_items)
+        write_checkpoint(checkpoint_path, args.input, settings, rows_done, output_bytes)
+
+        elapsed = time.perf_counter() - start
+        print(f"{rows_done} rows classified ({(rows_done - rows_at_start) / elapsed:.0f} rows/s)")
+    if store is not None:
+        print(f"Confirmed classifications: {store.stats()}")
+
+
+def import_confirmed(args: argparse.Namespace):
+    store = ConfirmedStore(args.confirmed)
+    imported = store.import_table(args.input, column=args.column, path_column=args.path_column)
+    print(f"{imported} confirmed classifications imported, {len(store)} line items in {args.confirmed}.")
+
+
+def main(argv: Optional[List[str]] = None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    classify = subparsers.add_parser("classify", help="Classify the line items of a CSV or Parquet file.")
+    classify.add_argument("input", help="CSV or Parquet file with one line item per row.")
+    classify.add_argument("output", help="CSV file the results are appended to.")
+    classify.add_argument("--column", default="line_item", help="Column holding the line item text.")
+    classify.add_argument("--chunk-size", type=int, default=1000, help="Rows classified per chunk.")
+    classify.add_argument("--classifier", choices=CLASSIFIERS, default="index")
+    classify.add_argument("--hierarchy", help="Hierarchy file with L1..Ln columns (default: demo hierarchy).")
+    classify.add_argument("--index-dir", default="./hierarchy_index",
+                          help="Directory of the saved HierarchyVectorIndex (built there if missing).")
+    classify.add_argument("--persist-directory", default="./chroma_langchain_db",
+                          help="Chroma directory for the vector classifier.")
+    classify.add_argument("--model", default="gpt-4o-mini", help="Chat model for the LLM classifiers.")
+    classify.add_argument("--checkpoint", help="Checkpoint file (default: <output>.checkpoint.json).")
+    classify.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint and output file and start over.")
+    classify.add_argument("--fake", action="store_true", help="Use offline fake embedding and chat models.")
+    classify.add_argument("--items-per-request", type=int, default=1,
+                          help="Line items the llm classifier decides per request at the same node.")
+    classify.add_argument("--confirmed",
+                          help="SQLite store of confirmed classifications; matching line items skip the classifier.")
+    classify.add_argument("--n-best", type=int, default=1,
+                          help="Beam search keeping this many paths; the ranked paths are written to an "
+                               "`alternatives` column (needs a scoring classifier: index, vector or lexical).")
+
+    confirmed = subparsers.add_parser("import-confirmed",
+                                      help="Import labeled line items into a store of confirmed classifications.")
+    confirmed.add_argument("input", help="CSV, Parquet or Excel file, e.g. a reviewed output of `classify`.")
+    confirmed.add_argument("confirmed", help="SQLite store of confirmed classifications (created if missing).")
+    confirmed.add_argument("--column", default="line_item", help="Column holding the line item text.")
+    confirmed.add_argument("--path-column", default="path_codes", help="Column holding the code path as JSON.")
+
+    args = parser.parse_args(argv)
+    if args.command == "classify" and args.n_best > 1 and args.confirmed:
+        parser.error("--n-best cannot be combined with --confirmed.")
+    if args.command == "classify" and args.n_best > 1 and args.classifier in ("llm", "fullpath"):
+        parser.error("--n-best needs a scoring classifier (index, vector or lexical).")
+    if args.command == "classify":
+        classify_file(args)
+    elif args.command == "import-confirmed":
+        import_confirmed(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+import os
+from collections import deque
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from Category import Category
+
+
+class MappedStrings(Sequence):
+    """
+    Read-only sequence of optional strings backed by (memory-mapped) numpy arrays: item i is
+    `values[i]` as a str, or None where `present[i]` is False. Strings are only created when
+    accessed, so processes mapping the same file share its pages instead of each holding a copy.
+    """
+
+    def __init__(self, values: np.ndarray, present: Optional[np.ndarray] = None):
+        self.values = values
+        self.present = present
+
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if self.present is not None and not self.present[index]:
+            return None
+        return str(self.values[index])
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+class CompactNode:
+    """
+    Lightweight view of one category of a CompactHierarchy.
+
+    It exposes the same attributes as Category (code, name, level, description, children, parent),
+    so classifiers, `recursive_classify` and `hierarchy_to_documents` can walk a CompactHierarchy
+    without materializing pydantic objects.
+    """
+    __slots__ = ("hierarchy", "index")
+
+    def __init__(self, hierarchy: "CompactHierarchy", index: int):
+        self.hierarchy = hierarchy
+        self.index = index
+
+    @property
+    def code(self) -> str:
+        return self.hierarchy.codes[self.index]
+
+    @property
+    def name(self) -> str:
+        return self.hierarchy.names[self.index]
+
+    @property
+    def level(self) -> int:
+        return int(self.hierarchy.levels[self.index])
+
+    @property
+    def description(self) -> Optional[str]:
+        return self.hierarchy.descriptions[self.index]
+
+    @property
+    def children(self) -> List["CompactNode"]:
+        return [self.hierarchy.node(i) for i in self.hierarchy.child_indices(self.index).tolist()]
+
+    @property
+    def parent(self) -> Optional["CompactNode"]:
+        parent = int(self.hierarchy.parents[self.index])
+        return self.hierarchy.node(parent) if parent >= 0 else None
+
+    def __str__(self):
+        return f"{self.code} : {self.name} (L{self.level})"
+
+    def __repr__(self):
+        return f"{self.code} : {self.name} (L{self.level})"
+
+
+class CompactHierarchy:
+    """
+    Array-backed category hierarchy for large trees.
+
+    Categories are identified by their index in parallel arrays:
+      - codes, names, descriptions: per-category strings
+      - levels: per-category level
+      - parents: index of the parent (-1 for roots)
+      - children[child_offsets[i]:child_offsets[i + 1]]: indices of the children of category i (CSR)
+
+    Lookups by code and by path of codes go through dict indexes instead of tree walks.
+    """
+
+    def __init__(self, codes: Sequence[str], names: Sequence[str], levels: Sequence[int], parents: Sequence[int],
+                 descriptions: Optional[Sequence[Optional[str]]] = None):
+        self.codes = list(codes)
+        # Memory-mapped names and descriptions (see `load`) are kept as they are.
+        self.names = names if isinstance(names, MappedStrings) else list(names)
+        if descriptions is None:
+            descriptions = [None] * len(self.codes)
+        self.descriptions = descriptions if isinstance(descriptions, MappedStrings) else list(descriptions)
+        self.levels = np.asarray(levels, dtype=np.int32)
+        self.parents = np.asarray(parents, dtype=np.int64)
+
+        # Group the categories by parent (keeping their order within a parent) to get the CSR layout.
+        has_parent = self.parents >= 0
+        order = np.argsort(self.parents, kind="stable")
+        self.roots = order[:len(order) - int(has_parent.sum())]
+        self.children = order[len(self.roots):]
+        self.child_offsets = np.zeros(len(self.codes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.parents[has_parent], minlength=len(self.codes)), out=self.child_offsets[1:])
+
+        self.code_index: Dict[str, int] = {}
+        for i, code in enumerate(self.codes):
+            self.code_index.setdefault(code, i)
+        self._path_index: Optional[Dict[Tuple[str, ...], int]] = None
+        self._nodes: Dict[int, CompactNode] = {}
+
+    @classmethod
+    def from_category(cls, root: Category) -> "CompactHierarchy":
+        """
+        Build from a Category tree (breadth-first, so the children of a node have consecutive indices).
+        """
+        codes, names, descriptions, levels, parents = [], [], [], [], []
+        queue = deque([(root, -1)])
+        while queue:
+            category, parent = queue.popleft()
+            index = len(codes)
+            codes.append(category.code)
+            names.append(category.name)
+            descriptions.append(category.description)
+            levels.append(category.level)
+            parents.append(parent)
+            queue.extend((child, index) for child in category.children)
+        return cls(codes, names, levels, parents, descriptions)
+
+    def to_category(self) -> Category:
+        """
+        Materialize the (first) root and its descendants as a Category tree.
+        """
+        return self.to_categories()[0]
+
+    def to_categories(self) -> List[Category]:
+        """
+        Materialize the hierarchy as Category trees, one per root.
+        """
+        categories = [Category(code=code, name=name, level=int(level), description=description)
+                      for code, name, level, description in
+                      zip(self.codes, self.names, self.levels, self.descriptions)]
+        for index, parent in enumerate(self.parents.tolist()):
+            if parent >= 0:
+                # Children are unique by construction, so skip the duplicate scan of add_child.
+                categories[parent].children.append(categories[index])
+                categories[index].parent = categories[parent]
+        return [categories[root] for root in self.roots.tolist()]
+
+    def save(self, directory: str):
+        """
+        Save the hierarchy as .npy files in the given directory.
+        """
+        os.makedirs(directory, exist_ok=True)
+        arrays = {"hierarchy_codes": np.array(self.codes, dtype=str),
+                  "hierarchy_names": np.array(self.names, dtype=str),
+                  "hierarchy_descriptions": np.array([d or "" for d in self.descriptions], dtype=str),
+                  "hierarchy_has_description": np.array([d is not None for d in self.descriptions], dtype=bool),
+                  "hierarchy_levels": self.levels,
+                  "hierarchy_parents": self.parents}
+        for name, array in arrays.items():
+            np.save(os.path.join(directory, f"{name}.npy"), array)
+
+    @classmethod
+    def load(cls, directory: str) -> "CompactHierarchy":
+        """
+        Load a hierarchy saved with `save`. The levels, parents, names and descriptions stay
+        memory-mapped, so processes loading the same hierarchy share their pages in the page cache.
+        The codes are read into a list in every process, as the lookup by code indexes all of them
+        (the child index arrays are computed per process too).
+        """
+        def load_array(name: str) -> np.ndarray:
+            return np.load(os.path.join(directory, f"hierarchy_{name}.npy"), mmap_mode="r")
+
+        return cls(codes=load_array("codes").tolist(), names=MappedStrings(load_array("names")),
+                   levels=load_array("levels"), parents=load_array("parents"),
+                   descriptions=MappedStrings(load_array("descriptions"), load_array("has_description")))
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def node(self, index: int) -> CompactNode:
+        """
+        View of the category at `index`. The same view object is returned on every call.
+        """
+        node = self._nodes.get(index)
+        if node is None:
+            node = self._nodes[index] = CompactNode(self, index)
+        return node
+
+    @property
+    def root(self) -> CompactNode:
+        return self.node(int(self.roots[0]))
+
+    def child_indices(self, index: int) -> np.ndarray:
+        return self.children[self.child_offsets[index]:self.child_offsets[index + 1]]
+
+    def path(self, index: int) -> Tuple[str, ...]:
+        """
+        Codes from the root down to the category at `index`.
+        """
+        path = []
+        while index >= 0:
+            path.append(self.codes[index])
+            index = int(self.parents[index])
+        return tuple(reversed(path))
+
+    def find(self, code: str) -> Optional[CompactNode]:
+        """
+        First category with the given code.
+        """
+        index = self.code_index.get(code)
+        return self.node(index) if index is not None else None
+
+    def find_path(self, path: Sequence[str]) -> Optional[CompactNode]:
+        """
+        Category at the given path of codes from the root.
+        """
+        if self._path_index is None:
+            self._path_index = {}
+            stack = [(int(root), (self.codes[root],)) for root in self.roots]
+            while stack:
+                index, index_path = stack.pop()
+                self._path_index[index_path] = index
+                stack.extend((int(child), index_path + (self.codes[child],))
+                             for child in self.child_indices(index))
+        index = self._path_index.get(tuple(path))
+        return self.node(index) if index is not None else None
@@ -0,0 +1,226 @@
+import json
+import math
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from Category import Category
+from classifiers import BaseClassifier, classify_batch, recursive_classify
+from excel_loaders import read_table_in_chunks
+from instrumentation import get_instrumentation
+from utils import normalize_text
+
+# A confirmed classification: the codes of the categories from the top level down (root excluded).
+CodePath = Tuple[str, ...]
+
+
+class ConfirmedStore:
+    """
+    Line items whose classification path has been confirmed (e.g. reviewed by a person), used to
+    classify repeats and trivial variants of them without calling any model.
+
+    A lookup first tries an exact match on the normalized text. Otherwise the character n-grams of
+    the line item are looked up in an inverted index, and the most similar stored line item is used
+    if the Jaccard similarity of their n-gram sets reaches `threshold`. Candidates are generated with
+    prefix filtering: a stored line item can only reach the threshold if it shares one of the
+    query's rarest n-grams, so common n-grams never have their (long) posting lists scanned. Of
+    those, the `max_candidates` sharing the most of these n-grams are compared exactly.
+
+    With a `path`, confirmed classifications are persisted in a SQLite file and loaded on startup.
+    """
+
+    def __init__(self, path: Optional[str] = None, threshold: float = 0.8, ngram_size: int = 3,
+                 max_candidates: int = 50):
+        """
+        Parameters:
+          - path: optional SQLite file persisting the store.
+          - threshold: minimum Jaccard similarity of the n-gram sets for an approximate match.
+          - ngram_size: length of the character n-grams compared.
+          - max_candidates: bound on the stored line items compared exactly per lookup.
+        """
+        self.threshold = threshold
+        self.ngram_size = ngram_size
+        self.max_candidates = max_candidates
+        self.exact_hits = 0
+        self.approximate_hits = 0
+        self.misses = 0
+        self._texts: List[str] = []
+        self._paths: List[CodePath] = []
+        self._entry_of_text: Dict[str, int] = {}
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+        self._lock = threading.Lock()
+        self._connection = None
+        if path is not None:
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            self._connection.execute("CREATE TABLE IF NOT EXISTS confirmed (text TEXT PRIMARY KEY, path TEXT)")
+            self._connection.commit()
+            for text, code_path in self._connection.execute("SELECT text, path FROM confirmed"):
+                self._remember(text, tuple(json.loads(code_path)))
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    @staticmethod
+    def normalize(line_item: str) -> str:
+        return normalize_text(line_item).casefold()
+
+    def _ngrams(self, text: str) -> Set[str]:
+        # Pad with spaces so the start and end of the text form n-grams of their own.
+        padded = f" {text} "
+        return {padded[i:i + self.ngram_size] for i in range(max(len(padded) - self.ngram_size + 1, 1))}
+
+    def _remember(self, text: str, code_path: CodePath):
+        entry = self._entry_of_text.get(text)
+        if entry is not None:
+            # A newer confirmation of the same text replaces the old path.
+            self._paths[entry] = code_path
+            return
+        entry = len(self._texts)
+        self._texts.append(text)
+        self._paths.append(code_path)
+        self._entry_of_text[text] = entry
+        for ngram in self._ngrams(text):
+            self._postings[ngram].append(entry)
+
+    def add(self, line_item: str, code_path: Sequence[str]):
+        """
+        Record the confirmed classification path (codes, root excluded) of a line item.
+        """
+        self.add_many([(line_item, code_path)])
+
+    def add_many(self, items: Iterable[Tuple[str, Sequence[str]]]) -> int:
+        """
+        Bulk import of (line item, code path) pairs, e.g. historical labeled data, in one transaction.
+        Returns the number of pairs imported.
+        """
+        rows = [(self.normalize(line_item), tuple(code_path)) for line_item, code_path in items]
+        with self._lock:
+            for text, code_path in rows:
+                self._remember(text, code_path)
+            if self._connection is not None:
+                self._connection.executemany("INSERT OR REPLACE INTO confirmed VALUES (?, ?)",
+                                             [(text, json.dumps(code_path)) for text, code_path in rows])
+                self._connection.commit()
+        return len(rows)
+
+    def import_table(self, file_path: str, column: str = "line_item", path_column: str = "path_codes",
+                     chunksize: int = 100_000) -> int:
+        """
+        Bulk import a CSV, Parquet or Excel file with a line item column and a column holding the
+        code path as a JSON list, such as a (reviewed) output file of `cli.py classify`.
+        Rows without a path are skipped. Returns the number of rows imported.
+        """
+        imported = 0
+        for chunk in read_table_in_chunks(file_path, chunksize):
+            chunk = chunk.dropna(subset=[column, path_column])
+            code_paths = [json.loads(code_path) for code_path in chunk[path_column]]
+            imported += self.add_many((line_item, code_path)
+                                      for line_item, code_path in zip(chunk[column].astype(str), code_paths)
+                                      if code_path)
+        return imported
+
+    def _most_similar(self, text: str) -> Tuple[Optional[int], float]:
+        query = self._ngrams(text)
+        # Any stored n-gram set with a Jaccard similarity >= threshold shares at least one of the
+        # query's `len(query) - ceil(threshold * len(query)) + 1` rarest n-grams.
+        ngrams = sorted(query, key=lambda ngram: len(self._postings.get(ngram, ())))
+        prefix = ngrams[:len(query) - math.ceil(self.threshold * len(query)) + 1]
+        candidates = Counter()
+        for ngram in prefix:
+            candidates.update(self._postings.get(ngram, ()))
+
+        best_entry, best_similarity = None, 0.0
+        for entry, _ in candidates.most_common(self.max_candidates):
+            stored = self._ngrams(self._texts[entry])
+            shared = len(query & stored)
+            similarity = shared / (len(query) + len(stored) - shared)
+            if similarity > best_similarity:
+                best_entry, best_similarity = entry, similarity
+        return best_entry, best_similarity
+
+    def lookup(self, line_item: str) -> Optional[Tuple[CodePath, float, str]]:
+        """
+        Confirmed code path for the line item, the similarity of the match (1.0 if exact) and the
+        confirmed line item it was matched to, or None.
+        """
+        text = self.normalize(line_item)
+        instrumentation = get_instrumentation()
+        with self._lock:
+            entry = self._entry_of_text.get(text)
+            if entry is not None:
+                self.exact_hits += 1
+                instrumentation.count("confirmed_exact_hits")
+                return self._paths[entry], 1.0, text
+
+            entry, similarity = self._most_similar(text)
+            if entry is None or similarity < self.threshold:
+                self.misses += 1
+                instrumentation.count("confirmed_misses")
+                return None
+            self.approximate_hits += 1
+            instrumentation.count("confirmed_approximate_hits")
+            return self._paths[entry], similarity, self._texts[entry]
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Hit counters of the store; every hit is a whole classification path without model calls.
+        """
+        total = self.exact_hits + self.approximate_hits + self.misses
+        hits = self.exact_hits + self.approximate_hits
+        return {"entries": len(self), "exact_hits": self.exact_hits, "approximate_hits": self.approximate_hits,
+                "misses": self.misses, "hit_rate": hits / total if total else 0.0}
+
+
+def resolve_code_path(root: Category, code_path: Sequence[str]) -> Optional[List[Category]]:
+    """
+    Categories along a path of codes below `root`, or None if the path no longer exists in the tree.
+    """
+    categories = []
+    category = root
+    for code in code_path:
+        category = next((child for child in category.children if child.code == code), None)
+        if category is None:
+            return None
+        categories.append(category)
+    return categories
+
+
+def _confirmed_path(
+        line_item: str, root: Category, store: ConfirmedStore
+) -> Optional[List[Tuple[Category, float, Optional[str]]]]:
+    match = store.lookup(line_item)
+    if match is None:
+        return None
+    code_path, similarity, confirmed_text = match
+    categories = resolve_code_path(root, code_path)
+    # Only complete paths are used, e.g. not after the leaf was split into subcategories.
+    if categories is None or categories[-1].children:
+        return None
+    warning = "" if similarity == 1.0 else f"Matched confirmed line item \"{confirmed_text}\"."
+    return [(category, similarity, warning) for category in categories]
+
+
+def recursive_classify_with_confirmed(
+        line_item: str, root: Category, classifier: BaseClassifier, store: ConfirmedStore
+) -> List[Tuple[Category, float, Optional[str]]]:
+    """
+    `recursive_classify`, except that line items matching a confirmed classification take the
+    confirmed path without any model or vector call. The confidence is the similarity of the match.
+    """
+    path = _confirmed_path(line_item, root, store)
+    return path if path is not None else recursive_classify(line_item, root, classifier)
+
+
+def classify_batch_with_confirmed(
+        line_items: List[str], root: Category, classifier: BaseClassifier, store: ConfirmedStore
+) -> List[List[Tuple[Category, float, Optional[str]]]]:
+    """
+    `classify_batch` for the line items that do not match a confirmed classification; the others
+    take the confirmed path.
+    """
+    classification_paths = [_confirmed_path(line_item, root, store) for line_item in line_items]
+    remaining = [i for i, path in enumerate(classification_paths) if path is None]
+    for i, path in zip(remaining, classify_batch([line_items[i] for i in remaining], root, classifier)):
+        classification_paths[i] = path
+    return classification_paths
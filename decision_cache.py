@@ -0,0 +1,120 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from instrumentation import get_instrumentation
+from utils import normalize_text
+
+# A cached decision: (selected category code, confidence, warning).
+Decision = Tuple[str, float, Optional[str]]
+
+
+class DecisionCache:
+    """
+    Memoizes per-level classification decisions of an (expensive) classifier.
+
+    A decision is keyed by the normalized line item, the codes of the candidate categories and a
+    fingerprint of the prompt/model that made it. Decisions live in an in-memory LRU and,
+    optionally, in a SQLite file that persists across runs. Entries older than `ttl_seconds` are
+    ignored, and the on-disk tier is trimmed to the `max_disk_entries` most recent entries on every
+    write that exceeds it.
+    """
+
+    # Expired entries are deleted from the on-disk tier every this many writes (they are ignored
+    # on reads in between), and its entry count is recounted.
+    EVICTION_INTERVAL = 100
+
+    def __init__(self, memory_size: int = 10_000, path: Optional[str] = None,
+                 ttl_seconds: Optional[float] = None, max_disk_entries: Optional[int] = None):
+        self.memory_size = memory_size
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_entries = max_disk_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, Tuple[Decision, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._connection = None
+        if path is not None:
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS decisions "
+                "(key TEXT PRIMARY KEY, code TEXT, confidence REAL, warning TEXT, created REAL)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS decisions_created ON decisions (created)")
+            self._connection.commit()
+            self._disk_entries = self._count()
+
+    def _count(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM decisions").fetchone()[0]
+
+    @staticmethod
+    def key(line_item: str, candidate_codes: List[str], fingerprint: str) -> str:
+        text = "\0".join([fingerprint, normalize_text(line_item).casefold(), "\x1f".join(candidate_codes)])
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - created > self.ttl_seconds
+
+    def _remember(self, key: str, decision: Decision, created: float):
+        self._memory[key] = (decision, created)
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Decision]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+            elif self._connection is not None:
+                row = self._connection.execute(
+                    "SELECT code, confidence, warning, created FROM decisions WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    entry = (row[0], row[1], row[2]), row[3]
+                    self._remember(key, *entry)
+
+            if entry is None or self._expired(entry[1]):
+                self.misses += 1
+                get_instrumentation().count("decision_cache_misses")
+                return None
+            self.hits += 1
+            get_instrumentation().count("decision_cache_hits")
+            return entry[0]
+
+    def put(self, key: str, decision: Decision):
+        created = time.time()
+        with self._lock:
+            self._remember(key, decision, created)
+            if self._connection is None:
+                return
+            exists = self._connection.execute("SELECT 1 FROM decisions WHERE key = ?", (key,)).fetchone()
+            self._connection.execute("INSERT OR REPLACE INTO decisions VALUES (?, ?, ?, ?, ?)",
+                                     (key, *decision, created))
+            self._disk_entries += exists is None
+            self._writes += 1
+            if self._writes % self.EVICTION_INTERVAL == 0:
+                self._evict_expired()
+            if self.max_disk_entries is not None and self._disk_entries > self.max_disk_entries:
+                # Drop the oldest entries; the index on `created` keeps this cheap.
+                self._connection.execute(
+                    "DELETE FROM decisions WHERE key IN (SELECT key FROM decisions ORDER BY created, rowid LIMIT ?)",
+                    (self._disk_entries - self.max_disk_entries,))
+                self._disk_entries = self.max_disk_entries
+            self._connection.commit()
+
+    def _evict_expired(self):
+        if self.ttl_seconds is not None:
+            self._connection.execute("DELETE FROM decisions WHERE created < ?", (time.time() - self.ttl_seconds,))
+        # Recount, as other processes may write to the same file.
+        self._disk_entries = self._count()
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Hit rate of the cache; every hit is one classifier call saved.
+        """
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0,
+                "saved_calls": self.hits}
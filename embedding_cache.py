@@ -0,0 +1,131 @@
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from instrumentation import get_instrumentation
+from utils import normalize_text
+
+
+def embedding_namespace(embeddings: Embeddings) -> str:
+    """
+    Model name of an embedding model plus its output size when that is configurable (`dimensions` of
+    OpenAIEmbeddings, `size` of FakeLatencyEmbeddings), so that models returning vectors of different
+    sizes never share cache entries.
+    """
+    name = getattr(embeddings, "model", None) or type(embeddings).__name__
+    size = getattr(embeddings, "dimensions", None) or getattr(embeddings, "size", None)
+    return f"{name}-{size}" if size else name
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Content-addressed, persistent cache around any LangChain Embeddings.
+
+    Vectors are keyed by a namespace (the model name and output size, see `embedding_namespace`) plus
+    a hash of the normalized text and stored as float32
+    blobs in a local SQLite file, with an in-memory LRU in front of it. Batched calls look up all
+    texts at once and send only the misses to the wrapped model, in a single call.
+
+    Queries and documents share the cache, i.e. the wrapped model is assumed to embed both the same
+    way (as OpenAIEmbeddings does).
+    """
+
+    def __init__(self, embeddings: Embeddings, path: str = "./embedding_cache.sqlite",
+                 namespace: Optional[str] = None, memory_size: int = 10_000):
+        """
+        Parameters:
+          - embeddings: the embedding model to wrap.
+          - path: SQLite file used as the persistent tier (":memory:" to keep it in-process only).
+          - namespace: part of the cache key; defaults to `embedding_namespace(embeddings)`. Pass one
+            explicitly for models whose configuration `embedding_namespace` cannot see.
+          - memory_size: number of vectors kept in the in-memory LRU.
+        """
+        self.embeddings = embeddings
+        self.namespace = namespace or embedding_namespace(embeddings)
+        self.memory_size = memory_size
+        self.hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+        self._connection.commit()
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.namespace}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector: List[float]):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """
+        Bulk lookup of cached vectors; keys that are not cached are missing from the result.
+        """
+        found = {}
+        missing = []
+        for key in keys:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                found[key] = self._memory[key]
+            else:
+                missing.append(key)
+
+        # Stay below SQLite's limit on the number of query parameters.
+        for start in range(0, len(missing), 500):
+            chunk = missing[start:start + 500]
+            rows = self._connection.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+            for key, blob in rows:
+                vector = np.frombuffer(blob, dtype=np.float32).tolist()
+                found[key] = vector
+                self._remember(key, vector)
+        return found
+
+    def put_many(self, vectors: Dict[str, List[float]]):
+        """
+        Bulk insert of vectors into both cache tiers.
+        """
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+            [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in vectors.items()])
+        self._connection.commit()
+        for key, vector in vectors.items():
+            self._remember(key, vector)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(text) for text in texts]
+        with self._lock:
+            found = self.get_many(keys)
+            # Embed each missing text once, even if it occurs several times in the batch.
+            missing = {key: text for key, text in zip(keys, texts) if key not in found}
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        instrumentation = get_instrumentation()
+        instrumentation.count("embedding_cache_hits", len(texts) - len(missing))
+        instrumentation.count("embedding_cache_misses", len(missing))
+        if missing:
+            # Round to float32 right away, so a miss returns exactly what later hits will return.
+            new_vectors = dict(zip(missing, np.asarray(self.embeddings.embed_documents(list(missing.values())),
+                                                       dtype=np.float32).tolist()))
+            with self._lock:
+                self.put_many(new_vectors)
+            found.update(new_vectors)
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Hit/miss counters of the cache since it was created.
+        """
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
@@ -1,9 +1,28 @@
 # === Excel Loader for Hierarchical Levels ===
 import math
+import os
 import pandas as pd
-from typing import List, Tuple, Dict
+from typing import Dict, Iterator, List, Optional, Tuple
 
 from Category import Category
+from compact_hierarchy import CompactHierarchy
+
+
+def _level_columns(columns) -> List[str]:
+    """
+    Columns that represent levels (L1, L2, L3, ...), ordered by level.
+    """
+    return sorted([col for col in columns if str(col).startswith("L")],
+                  key=lambda x: int(x[1:]) if x[1:].isdigit() else math.inf)
+
+
+def _level_number(level_columns: List[str]) -> Dict[str, int]:
+    """
+    Integer level of each level column: the number in its label (L1 -> 1), or its position
+    among the level columns (counting from 1) when the label has no number.
+    """
+    return {col: int(col[1:]) if col[1:].isdigit() else position
+            for position, col in enumerate(level_columns, start=1)}
 
 def load_hierarchy_from_excel_levels(file_path: str) -> List[Category]:
     """
@@ -13,8 +32,8 @@ def load_hierarchy_from_excel_levels(file_path: str) -> List[Category]:
     df = pd.read_excel(file_path)
 
     # Identify all columns that represent levels, e.g., L1, L2, L3, etc.
-    level_columns = sorted([col for col in df.columns if col.startswith("L")],
-                           key=lambda x: int(x[1:]) if x[1:].isdigit() else math.inf)
+    level_columns = _level_columns(df.columns)
+    level_numbers = _level_number(level_columns)
 
     # Dictionary to hold nodes keyed by the tuple representing the path
     tree_dict: Dict[Tuple[str, ...], Category] = {}
@@ -37,7 +56,7 @@ def load_hierarchy_from_excel_levels(file_path: str) -> List[Category]:
                 # For simplicity, we use the cell value for both code and name.
                 new_cat = Category(code=cell_value,
                                    name=cell_value,
-                                   level=level, # TODO -> needs to be checked
+                                   level=level_numbers[level],
                                    children=[])
                 tree_dict[key] = new_cat
 
@@ -53,6 +72,118 @@ def load_hierarchy_from_excel_levels(file_path: str) -> List[Category]:
     return list(roots.values())
 
 
+def read_table_in_chunks(file_path: str, chunksize: int, skip_rows: int = 0) -> Iterator[pd.DataFrame]:
+    """
+    Read a CSV, Parquet or Excel file as DataFrames of at most `chunksize` rows,
+    starting after the first `skip_rows` data rows.
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == ".csv":
+        # Read cells as text, so codes such as "01" keep their formatting.
+        # A callable rather than a range, which pandas would turn into a set of all skipped rows.
+        yield from pd.read_csv(file_path, dtype=str, chunksize=chunksize,
+                               skiprows=lambda row: 0 < row <= skip_rows)
+        return
+    if extension == ".parquet":
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(file_path).iter_batches(batch_size=chunksize):
+            if skip_rows >= batch.num_rows:
+                skip_rows -= batch.num_rows
+                continue
+            # Integer columns with nulls become Python ints (not floats), as in every other batch.
+            yield batch.slice(skip_rows).to_pandas(integer_object_nulls=True)
+            skip_rows = 0
+        return
+
+    for chunk in _read_spreadsheet_in_chunks(file_path, chunksize):
+        if skip_rows >= len(chunk):
+            skip_rows -= len(chunk)
+            continue
+        yield chunk.iloc[skip_rows:]
+        skip_rows = 0
+
+
+def _read_spreadsheet_in_chunks(file_path: str, chunksize: int) -> Iterator[pd.DataFrame]:
+    """
+    Read an Excel file as DataFrames of at most `chunksize` rows. Cells keep the value stored in the
+    sheet (dtype object), so a cell is formatted the same way whatever chunk it falls into.
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in (".xlsx", ".xlsm"):
+        from openpyxl import load_workbook
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [str(col) for col in next(rows)]
+            chunk = []
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) == chunksize:
+                    yield pd.DataFrame(chunk, columns=header, dtype=object)
+                    chunk = []
+            if chunk:
+                yield pd.DataFrame(chunk, columns=header, dtype=object)
+        finally:
+            workbook.close()
+    else:
+        yield pd.read_excel(file_path, dtype=object)
+
+
+def load_compact_hierarchy_from_table(file_path: str, chunksize: int = 100_000) -> CompactHierarchy:
+    """
+    Loads a CSV, Parquet or Excel file where each row contains columns L1, L2, L3, ... Ln representing
+    a full path in the hierarchy, as a CompactHierarchy.
+
+    The file is read in chunks of `chunksize` rows, so memory is bounded by the chunk size plus the
+    number of distinct categories. Within a chunk, paths are deduplicated per level with pandas,
+    and only distinct paths are visited in Python. Each category gets the integer level of its column.
+    """
+    node_index: Dict[Tuple[str, ...], int] = {}
+    codes: List[str] = []
+    levels: List[int] = []
+    parents: List[int] = []
+    level_columns: Optional[List[str]] = None
+
+    for chunk in read_table_in_chunks(file_path, chunksize):
+        if level_columns is None:
+            level_columns = _level_columns(chunk.columns)
+            level_numbers = _level_number(level_columns)
+        cells = chunk[level_columns]
+        # A path ends at its first missing value.
+        present = cells.notna().cumprod(axis=1).astype(bool)
+        cells = cells.apply(lambda column: column.astype(str).str.strip())
+
+        for depth, level in enumerate(level_columns):
+            path_columns = level_columns[:depth + 1]
+            # Distinct paths of this length, in order of first appearance.
+            paths = cells.loc[present[level], path_columns].drop_duplicates()
+            for path in paths.itertuples(index=False, name=None):
+                if path in node_index:
+                    continue
+                node_index[path] = len(codes)
+                # For simplicity, we use the cell value for both code and name.
+                codes.append(path[-1])
+                levels.append(level_numbers[level])
+                parents.append(node_index[path[:-1]] if depth else -1)
+
+    return CompactHierarchy(codes=codes, names=codes, levels=levels, parents=parents)
+
+
+def load_hierarchy_from_table(file_path: str, chunksize: int = 100_000) -> List[Category]:
+    """
+    Chunked, vectorized replacement of `load_hierarchy_from_excel_levels` that also reads CSV and
+    Parquet files. Returns the same list of root Category objects, whatever the chunk size.
+
+    Codes are the text of each cell on its own. For sheets with text cells this matches
+    `load_hierarchy_from_excel_levels`; numeric cells differ, as the old loader formats them after
+    pandas has inferred a float dtype for a column with blanks or a row mixing ints and floats
+    (101 becomes "101.0"), while here an integer cell always becomes "101", as in a CSV export. The
+    same holds for integer Parquet columns with nulls.
+    """
+    hierarchy = load_compact_hierarchy_from_table(file_path, chunksize=chunksize)
+    return hierarchy.to_categories() if len(hierarchy) else []
+
+
 # def load_hierarchy_from_excel(file_path: str) -> List[Category]:
 #     df = pd.read_excel(file_path)
 #     # Create a mapping from code to Category
@@ -0,0 +1,104 @@
+"""
+Offline stand-ins for the remote models, so classifiers can be exercised and benchmarked without
+OpenAI access. Latency is simulated with sleeps, so concurrency behaves like with a real backend.
+"""
+import asyncio
+import hashlib
+import json
+import re
+import time
+from typing import Any, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+CANDIDATE_LINE = re.compile(r"^(\d+)\. Code: (.*?), Name: (.*?), Description: (.*)$", re.MULTILINE)
+LINE_ITEM = re.compile(r'^Line item: "(.*)"$', re.MULTILINE)
+NUMBERED_LINE_ITEM = re.compile(r'^(\d+)\. "(.*)"$', re.MULTILINE)
+
+
+def _words(text: str) -> set:
+    return set(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+class FakeLatencyEmbeddings(Embeddings):
+    """
+    Deterministic embeddings computed locally after `latency` seconds per call.
+
+    Words and character trigrams are hashed into `size` dimensions, so texts sharing words get
+    similar vectors and vector classifiers make meaningful (if crude) decisions.
+    """
+
+    def __init__(self, size: int = 256, latency: float = 0.0):
+        self.size = size
+        self.latency = latency
+        self.calls = 0
+        self.texts = 0
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.size, dtype=np.float32)
+        for word in _words(text):
+            padded = f" {word} "
+            for feature in [word] + [padded[i:i + 3] for i in range(len(padded) - 2)]:
+                digest = hashlib.md5(feature.encode("utf-8")).digest()
+                vector[int.from_bytes(digest[:4], "little") % self.size] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency)
+        self.calls += 1
+        self.texts += len(texts)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class FakeLatencyChatModel(BaseChatModel):
+    """
+    Chat model that answers the LangChainLLMClassifier prompt after `latency` seconds.
+
+    It picks the candidate sharing the most words with the line item (the first one on ties)
+    and replies with the JSON the classifier's output parser expects. Prompts listing several
+    numbered line items are answered with one result per line item.
+    """
+    latency: float = 0.0
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-latency-chat-model"
+
+    def _answer(self, messages: List[BaseMessage]) -> ChatResult:
+        self.calls += 1
+        prompt = "\n".join(str(message.content) for message in messages)
+        candidate_words = [_words(f"{name} {description}")
+                           for _, _, name, description in CANDIDATE_LINE.findall(prompt)]
+
+        def select(line_item: str) -> int:
+            overlaps = [len(_words(line_item) & words) for words in candidate_words]
+            return overlaps.index(max(overlaps)) if overlaps else 0
+
+        line_item = LINE_ITEM.search(prompt)
+        if line_item is None and NUMBERED_LINE_ITEM.search(prompt):
+            content = json.dumps({"results": [
+                {"item_number": int(number), "selected_index": select(text), "confidence": 1, "warning": ""}
+                for number, text in NUMBERED_LINE_ITEM.findall(prompt)]})
+        else:
+            selected_index = select(line_item.group(1) if line_item else "")
+            content = json.dumps({"selected_index": selected_index, "confidence": 1, "warning": ""})
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        return self._answer(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return self._answer(messages)
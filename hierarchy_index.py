@@ -0,0 +1,210 @@
+import hashlib
+import json
+import os
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from Category import Category
+from classifiers import ScoringClassifier
+from embedding_cache import embedding_namespace
+from instrumentation import embedding_request
+from utils import normalize_rows
+from vector_embedding import category_code_path, category_to_text
+
+
+class HierarchyVectorIndex(ScoringClassifier):
+    """
+    In-process vector index over a Category tree, usable as a classifier without Chroma.
+
+    Categories are stored in breadth-first order, so the children of every node occupy a
+    contiguous block of rows in one float32 matrix of L2-normalized embeddings:
+      - vectors[i]: embedding of category i
+      - codes[i]: code of category i
+      - parents[i]: row of the parent of category i (-1 for the root)
+      - child_offsets[i]:child_offsets[i + 1]: rows of the children of category i
+
+    Choosing a child is therefore a small matrix-vector product over one row range, and a batch
+    of queries waiting at the same node is scored with a single matrix multiplication. As in
+    VectorClassifier, the confidence of a decision is the softmax probability of the best child
+    and close runners-up produce a warning.
+    """
+
+    FILES = ("vectors", "codes", "parents", "child_offsets")
+
+    def __init__(self, vectors: np.ndarray, codes: np.ndarray, parents: np.ndarray,
+                 child_offsets: np.ndarray, embeddings: Embeddings, margin: float = 0.05,
+                 temperature: float = 0.05, hierarchy_hash: Optional[str] = None):
+        """
+        Parameters:
+          - vectors, codes, parents, child_offsets: the index arrays (see `build` and `load`).
+          - embeddings: embedding model used for the line items.
+          - margin, temperature: see ScoringClassifier.
+          - hierarchy_hash: `hierarchy_fingerprint` of the tree the vectors were built from, saved with
+            the index (see `matches`).
+        """
+        super().__init__(margin=margin, temperature=temperature)
+        self.vectors = vectors
+        self.codes = codes
+        self.parents = parents
+        self.child_offsets = child_offsets
+        self.embeddings = embeddings
+        self.hierarchy_hash = hierarchy_hash
+        # Number of embedding round-trips made for line items so far.
+        self.embedding_calls = 0
+        self._row_by_path: Optional[Dict[Tuple[str, ...], int]] = None
+
+    @classmethod
+    def build(cls, root: Category, embeddings: Embeddings, batch_size: int = 512,
+              **kwargs) -> "HierarchyVectorIndex":
+        """
+        Embed every category of the tree (in batches of `batch_size`) and build the index.
+        `kwargs` (margin, temperature) are passed to the constructor.
+        """
+        nodes, parents, child_offsets = breadth_first_layout(root)
+        texts = [category_to_text(node) for node in nodes]
+        vectors = []
+        for start in range(0, len(texts), batch_size):
+            vectors.extend(embeddings.embed_documents(texts[start:start + batch_size]))
+
+        return cls(vectors=normalize_rows(np.asarray(vectors, dtype=np.float32)),
+                   codes=np.array([node.code for node in nodes]),
+                   parents=np.asarray(parents, dtype=np.int64),
+                   child_offsets=np.asarray(child_offsets, dtype=np.int64),
+                   embeddings=embeddings, hierarchy_hash=hierarchy_fingerprint(texts, parents), **kwargs)
+
+    def save(self, directory: str):
+        """
+        Save the index as .npy files in the given directory, with a fingerprint of the hierarchy and
+        the embedding model it was built from (see `matches`).
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name in self.FILES:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+        fingerprint = {"hierarchy": self.hierarchy_hash,
+                       "embedding_model": embedding_model_name(self.embeddings),
+                       "dimension": int(self.vectors.shape[1])}
+        with open(os.path.join(directory, "fingerprint.json"), "w") as f:
+            json.dump(fingerprint, f)
+
+    @staticmethod
+    def matches(directory: str, root: Category, embeddings: Embeddings) -> bool:
+        """
+        Whether the index saved in `directory` was built from this hierarchy (the same tree and the
+        same embedded text of every category) with this embedding model. Embeds one text to learn
+        the model's dimension.
+        """
+        fingerprint_path = os.path.join(directory, "fingerprint.json")
+        if not os.path.exists(fingerprint_path):
+            return False
+        with open(fingerprint_path) as f:
+            fingerprint = json.load(f)
+        nodes, parents, _ = breadth_first_layout(root)
+        texts = [category_to_text(node) for node in nodes]
+        return (fingerprint["hierarchy"] == hierarchy_fingerprint(texts, parents)
+                and fingerprint["embedding_model"] == embedding_model_name(embeddings)
+                and fingerprint["dimension"] == len(embeddings.embed_query(category_to_text(root))))
+
+    @classmethod
+    def load(cls, directory: str, embeddings: Embeddings, mmap: bool = True, **kwargs) -> "HierarchyVectorIndex":
+        """
+        Load an index saved with `save`. With `mmap=True` the arrays are memory-mapped read-only,
+        so loading is instant and processes opening the same files share their pages.
+        `kwargs` (margin, temperature) are passed to the constructor.
+        """
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r" if mmap else None)
+                  for name in cls.FILES}
+        fingerprint_path = os.path.join(directory, "fingerprint.json")
+        if os.path.exists(fingerprint_path):
+            with open(fingerprint_path) as f:
+                kwargs.setdefault("hierarchy_hash", json.load(f)["hierarchy"])
+        return cls(embeddings=embeddings, **arrays, **kwargs)
+
+    def _row_of(self, category: Category) -> int:
+        """
+        Row of a category, looked up by its path of codes from the root.
+        """
+        if self._row_by_path is None:
+            self._row_by_path = {path: row for row, path in
+                                 enumerate(code_paths(self.codes.tolist(), self.parents.tolist()))}
+        return self._row_by_path[tuple(category_code_path(category))]
+
+    def _child_rows(self, candidates: List[Category]) -> Tuple[int, int, List[int]]:
+        """
+        Row range of the candidates under their parent, and the position in `candidates` of each row.
+        """
+        parent_row = self._row_of(candidates[0].parent)
+        start, end = int(self.child_offsets[parent_row]), int(self.child_offsets[parent_row + 1])
+        position_by_code = {candidate.code: i for i, candidate in enumerate(candidates)}
+        positions = [position_by_code[code] for code in self.codes[start:end].tolist()]
+        return start, end, positions
+
+    def encode(self, line_item: str) -> np.ndarray:
+        self.embedding_calls += 1
+        with embedding_request([line_item]):
+            vector = self.embeddings.embed_query(line_item)
+        return normalize_rows(np.asarray(vector, dtype=np.float32))
+
+    async def aencode(self, line_item: str) -> np.ndarray:
+        self.embedding_calls += 1
+        with embedding_request([line_item]):
+            vector = await self.embeddings.aembed_query(line_item)
+        return normalize_rows(np.asarray(vector, dtype=np.float32))
+
+    def encode_batch(self, line_items: List[str]) -> List[np.ndarray]:
+        self.embedding_calls += 1
+        with embedding_request(line_items):
+            vectors = self.embeddings.embed_documents(line_items)
+        return list(normalize_rows(np.asarray(vectors, dtype=np.float32)))
+
+    def score_group(
+            self, line_items: List[str], candidates: List[Category], queries: List[np.ndarray]
+    ) -> np.ndarray:
+        start, end, positions = self._child_rows(candidates)
+        return self._candidate_scores(np.stack(queries) @ self.vectors[start:end].T, positions, len(candidates))
+
+
+def breadth_first_layout(root: Category) -> Tuple[List[Category], List[int], List[int]]:
+    """
+    Nodes of the tree in breadth-first order, the row of each node's parent (-1 for the root) and
+    the child offsets: the children of row i occupy rows child_offsets[i]:child_offsets[i + 1].
+    """
+    nodes: List[Category] = []
+    parents: List[int] = []
+    child_offsets = [1]
+    queue = deque([(root, -1)])
+    while queue:
+        node, parent_row = queue.popleft()
+        row = len(nodes)
+        nodes.append(node)
+        parents.append(parent_row)
+        for child in node.children:
+            queue.append((child, row))
+        # Children are appended to the queue in row order, so their rows are contiguous.
+        child_offsets.append(child_offsets[-1] + len(node.children))
+    return nodes, parents, child_offsets
+
+
+def code_paths(codes: List[str], parents: List[int]) -> List[Tuple[str, ...]]:
+    """
+    Path of codes from the root of every row of a breadth-first layout (parents before children).
+    """
+    paths: List[Tuple[str, ...]] = []
+    for code, parent_row in zip(codes, parents):
+        paths.append((paths[parent_row] if parent_row >= 0 else ()) + (code,))
+    return paths
+
+
+def hierarchy_fingerprint(texts: List[str], parents: List[int]) -> str:
+    """
+    Hash of the shape of a tree in breadth-first layout and of the embedded text (`category_to_text`,
+    which includes the code) of every node.
+    """
+    return hashlib.sha256(json.dumps([texts, parents]).encode("utf-8")).hexdigest()
+
+
+def embedding_model_name(embeddings: Embeddings) -> str:
+    # CachedEmbeddings exposes the namespace of the wrapped model, which includes its output size.
+    return getattr(embeddings, "namespace", None) or embedding_namespace(embeddings)
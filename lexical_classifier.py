@@ -0,0 +1,135 @@
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from Category import Category
+from classifiers import ScoringClassifier
+from hierarchy_index import breadth_first_layout, code_paths
+from instrumentation import get_instrumentation
+from vector_embedding import category_code_path
+
+# Query representation of a line item: column indices and TF-IDF weights of its n-grams.
+NGramVector = Tuple[np.ndarray, np.ndarray]
+
+
+class LexicalClassifier(ScoringClassifier):
+    """
+    Fully offline classifier comparing line items and categories by their character n-grams,
+    so no embedding or chat model is called.
+
+    The name and description of every category are vectorized once into a sparse TF-IDF matrix
+    with L2-normalized rows. As in HierarchyVectorIndex the rows are in breadth-first order, so the
+    children of every node form a contiguous block of rows: choosing among them is a sparse product
+    of the query vectors with that block (cosine similarities), for one line item or a whole group.
+    The confidence of a decision is the softmax probability of the best child, as in VectorClassifier.
+    """
+
+    def __init__(self, root: Category, ngram_range: Tuple[int, int] = (2, 4), analyzer: str = "char_wb",
+                 sublinear_tf: bool = True, margin: float = 0.05, temperature: float = 0.05):
+        """
+        Parameters:
+          - root: the root of the hierarchy.
+          - ngram_range: shortest and longest character n-grams used.
+          - analyzer: "char_wb" (n-grams inside word boundaries) or "char" (n-grams across words).
+          - sublinear_tf: weigh n-gram counts as 1 + log(count), so repeated words do not dominate.
+          - margin, temperature: see ScoringClassifier.
+        """
+        super().__init__(margin=margin, temperature=temperature)
+        nodes, parents, child_offsets = breadth_first_layout(root)
+        self.codes = [node.code for node in nodes]
+        self.vectorizer = TfidfVectorizer(analyzer=analyzer, ngram_range=ngram_range, lowercase=True,
+                                          sublinear_tf=sublinear_tf, dtype=np.float32)
+        self.matrix: sp.csr_matrix = self.vectorizer.fit_transform(
+            [self._category_text(node) for node in nodes]).tocsr()
+        self._analyzer = self.vectorizer.build_analyzer()
+        self._idf = self.vectorizer.idf_.astype(np.float32)
+
+        # Row range of the children of every node, keyed by the node's path of codes from the root.
+        self._child_rows: Dict[Tuple[str, ...], Tuple[int, int]] = {
+            path: (child_offsets[row], child_offsets[row + 1])
+            for row, path in enumerate(code_paths(self.codes, parents))}
+        # Transposed blocks of children, built on first use.
+        self._blocks: Dict[Tuple[int, int], sp.csr_matrix] = {}
+
+    @staticmethod
+    def _category_text(category: Category) -> str:
+        return f"{category.name} {category.description or ''}"
+
+    def _child_rows_of(self, candidates: List[Category]) -> Tuple[int, int, List[int]]:
+        """
+        Row range of the candidates under their parent, and the position in `candidates` of each row.
+        """
+        start, end = self._child_rows[tuple(category_code_path(candidates[0].parent))]
+        position_by_code = {candidate.code: i for i, candidate in enumerate(candidates)}
+        return start, end, [position_by_code[code] for code in self.codes[start:end]]
+
+    def _score_one(self, query: NGramVector, start: int, end: int) -> np.ndarray:
+        # Dot products straight from the CSR arrays of the rows: for a single query the fixed
+        # cost of a scipy sparse product would dominate.
+        indices, weights = query
+        dense_query = np.zeros(self.matrix.shape[1], dtype=np.float32)
+        dense_query[indices] = weights
+        indptr = self.matrix.indptr[start:end + 1]
+        columns = self.matrix.indices[indptr[0]:indptr[-1]]
+        values = self.matrix.data[indptr[0]:indptr[-1]]
+        rows = np.repeat(np.arange(end - start), np.diff(indptr))
+        return np.bincount(rows, weights=values * dense_query[columns], minlength=end - start)
+
+    def _score_many(self, queries: List[NGramVector], start: int, end: int) -> np.ndarray:
+        block = self._blocks.get((start, end))
+        if block is None:
+            block = self._blocks[start, end] = self.matrix[start:end].T.tocsr()
+        return (self._query_matrix(queries) @ block).toarray()
+
+    def encode(self, line_item: str) -> NGramVector:
+        """
+        TF-IDF vector of the line item, computed like `vectorizer.transform` but without its
+        per-call overhead (which is what dominates for a single short text).
+        """
+        counts = Counter(map(self.vectorizer.vocabulary_.get, self._analyzer(line_item)))
+        # N-grams that occur in no category.
+        counts.pop(None, None)
+        indices = np.fromiter(counts.keys(), dtype=np.int32, count=len(counts))
+        weights = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+        if self.vectorizer.sublinear_tf:
+            weights = 1 + np.log(weights)
+        weights *= self._idf[indices]
+        norm = np.linalg.norm(weights)
+        return indices, weights / norm if norm else weights
+
+    def encode_batch(self, line_items: List[str]) -> List[NGramVector]:
+        # Repeated line items (common in invoice exports) are vectorized once.
+        vectors: Dict[str, NGramVector] = {}
+        for line_item in line_items:
+            if line_item not in vectors:
+                vectors[line_item] = self.encode(line_item)
+        return [vectors[line_item] for line_item in line_items]
+
+    def _query_matrix(self, queries: List[NGramVector]) -> sp.csr_matrix:
+        indptr = np.zeros(len(queries) + 1, dtype=np.int64)
+        np.cumsum([len(indices) for indices, _ in queries], out=indptr[1:])
+        return sp.csr_matrix((np.concatenate([data for _, data in queries]),
+                              np.concatenate([indices for indices, _ in queries]), indptr),
+                             shape=(len(queries), self.matrix.shape[1]))
+
+    def score_group(
+            self, line_items: List[str], candidates: List[Category], queries: List[NGramVector]
+    ) -> np.ndarray:
+        start, end, positions = self._child_rows_of(candidates)
+        with get_instrumentation().timer("lexical_scoring"):
+            if len(queries) == 1:
+                similarities = self._score_one(queries[0], start, end)[None, :]
+            else:
+                similarities = self._score_many(queries, start, end)
+        return self._candidate_scores(similarities, positions, len(candidates))
+
+    def _undecidable(self, scores: np.ndarray) -> np.ndarray:
+        return ~(scores.max(axis=1) > 0)
+
+    def _fallback_decision(
+            self, scores: np.ndarray, candidates: List[Category]
+    ) -> Tuple[Category, float, Optional[str]]:
+        return candidates[int(scores.argmax())], 0.0, "The line item shares no character n-grams with any candidate."
@@ -1,5 +1,5 @@
 from Category import Category
-from classifiers import LangChainLLMClassifier, recursive_classify
+from classifiers import LangChainLLMClassifier, classify_many
 
 from dotenv import load_dotenv
 
@@ -21,18 +21,20 @@ if __name__ == "__main__":
 
     # Print the ASCII tree overview of the hierarchy.
     print("Hierarchy:")
-    print(hierarchy_roots.ascii_tree(prefix="", is_last=True))
+    for line in hierarchy_roots.iter_ascii_tree(prefix="", is_last=True):
+        print(line)
+    print()
 
 
     # Prepare test line items with expected classification paths.
     test_line_items = get_test_line_items()
     print("\n=== Test Line Items and Expected Classification Paths ===")
-    for line_item, expected_path in test_line_items.items():
-        # Classify the line item
-        result = recursive_classify(line_item=line_item,
-                                    category=hierarchy_roots,
-                                    classifier=classifier)
-
+    # Classify all line items concurrently (up to 8 LLM requests in flight).
+    results = classify_many(line_items=list(test_line_items),
+                            root=hierarchy_roots,
+                            classifier=classifier,
+                            max_concurrency=8)
+    for (line_item, expected_path), result in zip(test_line_items.items(), results):
         result_list = [x[0].name for x in result]
 
         print(f"Line Item: '{line_item}'")
@@ -0,0 +1,80 @@
+"""
+Multi-process batch classification.
+
+Every worker process opens the persisted hierarchy and HierarchyVectorIndex once at startup
+instead of receiving a pickled Category tree with each task. The index vectors and the
+hierarchy's integer arrays, names and descriptions are memory-mapped, so all workers share
+their pages; each worker only keeps its own copy of the category codes and the derived
+child/lookup indexes. Line items are dispatched in chunks and results come back in input order.
+"""
+import multiprocessing
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from Category import Category
+from classifiers import BaseClassifier, classify_batch
+from compact_hierarchy import CompactHierarchy
+from hierarchy_index import HierarchyVectorIndex
+from utils import batched
+
+# Classification path of one line item as sent back by a worker: (category code, confidence, warning) per level.
+CodePath = List[Tuple[str, float, Optional[str]]]
+
+# State of the current worker process, set up once by `_init_worker`.
+_worker = {}
+
+
+def save_worker_index(root: Category, embeddings: Embeddings, directory: str):
+    """
+    Persist everything the workers need, the hierarchy and its vector index, into `directory`.
+    """
+    CompactHierarchy.from_category(root).save(directory)
+    HierarchyVectorIndex.build(root, embeddings).save(directory)
+
+
+def _init_worker(directory: str, embeddings_factory: Callable[[], Embeddings],
+                 classifier_factory: Optional[Callable[[HierarchyVectorIndex], BaseClassifier]]):
+    hierarchy = CompactHierarchy.load(directory)
+    index = HierarchyVectorIndex.load(directory, embeddings_factory(), mmap=True)
+    _worker["root"] = hierarchy.root
+    _worker["classifier"] = classifier_factory(index) if classifier_factory is not None else index
+
+
+def _classify_chunk(line_items: List[str]) -> List[CodePath]:
+    paths = classify_batch(line_items, _worker["root"], _worker["classifier"])
+    return [[(category.code, confidence, warning) for category, confidence, warning in path] for path in paths]
+
+
+def iter_classify_parallel(
+        line_items: Iterable[str], directory: str, embeddings_factory: Callable[[], Embeddings],
+        workers: int = 4, chunk_size: int = 256,
+        classifier_factory: Optional[Callable[[HierarchyVectorIndex], BaseClassifier]] = None
+) -> Iterator[CodePath]:
+    """
+    Classify line items in a pool of `workers` processes, yielding one path per line item in input order.
+
+    Parameters:
+      - directory: directory written by `save_worker_index`.
+      - embeddings_factory: picklable callable creating the embedding model in each worker
+        (e.g. a class, or a functools.partial of one).
+      - chunk_size: number of line items sent to a worker per task.
+      - classifier_factory: optional picklable callable wrapping the index into the classifier
+        to use (e.g. a CascadeClassifier); defaults to the index itself.
+    """
+    with multiprocessing.Pool(workers, initializer=_init_worker,
+                              initargs=(directory, embeddings_factory, classifier_factory)) as pool:
+        for paths in pool.imap(_classify_chunk, batched(line_items, chunk_size)):
+            yield from paths
+
+
+def classify_parallel(
+        line_items: Iterable[str], directory: str, embeddings_factory: Callable[[], Embeddings],
+        workers: int = 4, chunk_size: int = 256,
+        classifier_factory: Optional[Callable[[HierarchyVectorIndex], BaseClassifier]] = None
+) -> List[CodePath]:
+    """
+    List-returning variant of `iter_classify_parallel`.
+    """
+    return list(iter_classify_parallel(line_items, directory, embeddings_factory, workers=workers,
+                                       chunk_size=chunk_size, classifier_factory=classifier_factory))
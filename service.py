@@ -0,0 +1,257 @@
+"""
+Long-running classification service that coalesces concurrent requests into micro-batches.
+
+    python service.py --classifier index --port 8765
+
+The hierarchy and the classifier (e.g. the HierarchyVectorIndex) are loaded once at startup.
+Clients connect over TCP and send one JSON object per line, e.g. {"id": 1, "line_item": "..."};
+every request is answered with one JSON line holding the same id and the classification path
+(the columns of `cli.py classify`), in the order the classifications complete.
+
+Requests arriving within `--max-wait-ms` of each other are classified together with one
+`classify_batch` call (one embedding request and one search per node for the whole batch), up to
+`--max-batch-size` line items. Identical line items in flight are classified once. The queue of
+waiting line items is bounded by `--max-queue-size`: when it is full, requests wait for room
+instead of piling up. A load test with fake backends is in benchmarks/service_benchmark.py.
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from Category import Category
+from classifiers import BaseClassifier, classify_batch
+from cli import CLASSIFIERS, build_classifier, load_root, result_row
+
+# Classification path of a line item: (category, confidence, warning) per level.
+Path = List[Tuple[Category, float, Optional[str]]]
+
+
+class MicroBatcher:
+    """
+    Classifies line items submitted concurrently with `classify` in micro-batches.
+
+    A batch is flushed once it holds `max_batch_size` line items or `max_wait` seconds after its
+    first line item arrived, whichever comes first. While a batch is being classified (in a worker
+    thread, so the event loop keeps accepting requests) the next one fills up, so batches grow
+    with the load. A line item submitted while an identical one is queued or being classified
+    shares its result.
+    """
+
+    def __init__(self, root: Category, classifier: BaseClassifier, max_batch_size: int = 64,
+                 max_wait: float = 0.005, max_queue_size: int = 1024):
+        """
+        Parameters:
+          - root: the root of the hierarchy.
+          - classifier: the classifier used by `classify_batch`.
+          - max_batch_size: most line items classified by one `classify_batch` call.
+          - max_wait: seconds the first line item of a batch waits for others to join it.
+          - max_queue_size: most distinct line items waiting; further submissions wait for room.
+        """
+        self.root = root
+        self.classifier = classifier
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_queue_size = max_queue_size
+        self.requests = 0
+        self.coalesced = 0
+        self.batches = 0
+        self.batched_items = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        # Number of requests waiting on each future in `_in_flight`.
+        self._waiters: Dict[asyncio.Future, int] = {}
+        # Queue insertions handed over from cancelled requests (see `_enqueue`).
+        self._handovers = set()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        for handover in list(self._handovers):
+            handover.cancel()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        # Requests still waiting get a CancelledError instead of hanging.
+        for future in self._in_flight.values():
+            future.cancel()
+        self._in_flight.clear()
+
+    async def classify(self, line_item: str) -> Path:
+        self.requests += 1
+        future = self._in_flight.get(line_item)
+        first = future is None
+        if first:
+            future = asyncio.get_running_loop().create_future()
+            self._in_flight[line_item] = future
+        else:
+            self.coalesced += 1
+        self._waiters[future] = self._waiters.get(future, 0) + 1
+        try:
+            if first:
+                await self._enqueue(line_item, future)
+            # Shielded, so a client going away does not cancel the result for the others waiting on it.
+            return await asyncio.shield(future)
+        finally:
+            self._waiters[future] -= 1
+            if not self._waiters[future]:
+                del self._waiters[future]
+
+    async def _enqueue(self, line_item: str, future: asyncio.Future):
+        try:
+            # Waits while the queue is full.
+            await self._queue.put(line_item)
+        except asyncio.CancelledError:
+            if self._waiters[future] > 1:
+                # Requests coalesced onto this one are still waiting: queue the line item for them.
+                handover = asyncio.create_task(self._queue.put(line_item))
+                self._handovers.add(handover)
+                handover.add_done_callback(self._handovers.discard)
+            else:
+                del self._in_flight[line_item]
+                future.cancel()
+            raise
+
+    async def _next_batch(self) -> List[str]:
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if self._queue.empty():
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            else:
+                batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            self.batches += 1
+            self.batched_items += len(batch)
+            try:
+                paths = await asyncio.to_thread(classify_batch, batch, self.root, self.classifier)
+            except Exception as e:
+                print(f"Error during batch classification: {e}. Retrying its line items one by one.")
+                await self._run_one_by_one(batch)
+                continue
+            for line_item, path in zip(batch, paths):
+                self._in_flight.pop(line_item).set_result(path)
+
+    async def _run_one_by_one(self, batch: List[str]):
+        """
+        Classify the line items of a failed batch separately, so one bad line item only fails its own requests.
+        """
+        for line_item in batch:
+            try:
+                path = (await asyncio.to_thread(classify_batch, [line_item], self.root, self.classifier))[0]
+            except Exception as e:
+                self._in_flight.pop(line_item).set_exception(e)
+            else:
+                self._in_flight.pop(line_item).set_result(path)
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Requests served, how many shared an identical line item in flight, and the batch sizes.
+        """
+        return {"requests": self.requests, "coalesced": self.coalesced, "batches": self.batches,
+                "mean_batch_size": self.batched_items / self.batches if self.batches else 0.0}
+
+
+async def start_server(classify: Callable[[str], Awaitable[Path]], host: str = "127.0.0.1",
+                       port: int = 8765, max_pipelined: int = 64) -> asyncio.AbstractServer:
+    """
+    TCP server answering JSON-lines requests with `classify`. Up to `max_pipelined` requests of
+    one connection are handled concurrently; beyond that the connection is not read from, so a
+    client sending faster than the service classifies is slowed down by TCP flow control.
+    """
+
+    async def answer(request_line: bytes, writer: asyncio.StreamWriter):
+        request = None
+        try:
+            request = json.loads(request_line)
+            if not isinstance(request["line_item"], str):
+                # Rejected before it can join (and fail) a micro-batch of other requests.
+                raise TypeError(f"line_item must be a string, not {type(request['line_item']).__name__}.")
+            response = {"id": request.get("id"), **result_row(request["line_item"],
+                                                               await classify(request["line_item"]))}
+        except Exception as e:
+            response = {"id": request.get("id") if isinstance(request, dict) else None, "error": str(e)}
+        writer.write(json.dumps(response).encode("utf-8") + b"\n")
+        await writer.drain()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        tasks = set()
+        pipelined = asyncio.Semaphore(max_pipelined)
+        try:
+            while request_line := await reader.readline():
+                await pipelined.acquire()
+                task = asyncio.create_task(answer(request_line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                task.add_done_callback(lambda _: pipelined.release())
+            await asyncio.gather(*tasks)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+async def serve(args: argparse.Namespace):
+    root = load_root(args.hierarchy)
+    batcher = MicroBatcher(root, build_classifier(args.classifier, root, args), max_batch_size=args.max_batch_size,
+                           max_wait=args.max_wait_ms / 1000, max_queue_size=args.max_queue_size)
+    await batcher.start()
+    server = await start_server(batcher.classify, args.host, args.port)
+    print(f"Serving {args.classifier} classifications on {args.host}:{args.port}.")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await batcher.stop()
+        print(f"Served: {batcher.stats()}")
+
+
+def main(argv: Optional[List[str]] = None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--classifier", choices=CLASSIFIERS, default="index")
+    parser.add_argument("--hierarchy", help="Hierarchy file with L1..Ln columns (default: demo hierarchy).")
+    parser.add_argument("--index-dir", default="./hierarchy_index",
+                        help="Directory of the saved HierarchyVectorIndex (built there if missing).")
+    parser.add_argument("--persist-directory", default="./chroma_langchain_db",
+                        help="Chroma directory for the vector classifier.")
+    parser.add_argument("--model", default="gpt-4o-mini", help="Chat model for the LLM classifiers.")
+    parser.add_argument("--fake", action="store_true", help="Use offline fake embedding and chat models.")
+    parser.add_argument("--items-per-request", type=int, default=1,
+                        help="Line items the llm classifier decides per request at the same node.")
+    parser.add_argument("--max-batch-size", type=int, default=64, help="Most line items per micro-batch.")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0,
+                        help="Milliseconds a micro-batch waits for more line items after its first one.")
+    parser.add_argument("--max-queue-size", type=int, default=1024,
+                        help="Most line items waiting to be batched before requests are held back.")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
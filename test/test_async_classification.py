@@ -0,0 +1,81 @@
+"""
+Offline tests of the async, concurrency-limited LLM classification driver, with the fake chat model.
+"""
+import asyncio
+from typing import Any
+
+from classifiers import LangChainLLMClassifier, aclassify_many, classify_many, recursive_classify
+from fakes import FakeLatencyChatModel
+from test.hierarchy_build import build_full_hierarchy
+from test.test_items import get_test_line_items
+
+
+class ConcurrencyTrackingChatModel(FakeLatencyChatModel):
+    """
+    Fake chat model recording the most requests it had in flight at once.
+    """
+    in_flight: int = 0
+    max_in_flight: int = 0
+
+    async def _agenerate(self, *args: Any, **kwargs: Any):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            return await super()._agenerate(*args, **kwargs)
+        finally:
+            self.in_flight -= 1
+
+
+class RateLimitedChatModel(FakeLatencyChatModel):
+    """
+    Fake chat model reporting a rate limit for its first `failures` requests.
+    """
+    failures: int = 2
+    attempts: int = 0
+
+    def _rate_limit(self):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            error = RuntimeError("Rate limit reached")
+            error.status_code = 429
+            raise error
+
+    def _generate(self, *args: Any, **kwargs: Any):
+        self._rate_limit()
+        return super()._generate(*args, **kwargs)
+
+    async def _agenerate(self, *args: Any, **kwargs: Any):
+        self._rate_limit()
+        return await super()._agenerate(*args, **kwargs)
+
+
+def codes(paths) -> list:
+    return [[category.code for category, _, _ in path] for path in paths]
+
+
+def test_async_results_match_the_blocking_driver():
+    root = build_full_hierarchy()
+    line_items = list(get_test_line_items())
+    classifier = LangChainLLMClassifier(model=FakeLatencyChatModel())
+    expected = [recursive_classify(line_item, root, classifier) for line_item in line_items]
+    assert codes(classify_many(line_items, root, classifier, max_concurrency=4)) == codes(expected)
+
+
+def test_requests_in_flight_never_exceed_the_limit():
+    model = ConcurrencyTrackingChatModel(latency=0.01)
+    line_items = list(get_test_line_items())
+    asyncio.run(aclassify_many(line_items, build_full_hierarchy(), LangChainLLMClassifier(model=model),
+                               max_concurrency=3))
+    assert model.max_in_flight == 3
+
+
+def test_rate_limited_requests_are_retried():
+    root = build_full_hierarchy()
+    model = RateLimitedChatModel()
+    classifier = LangChainLLMClassifier(model=model, max_retries=3, retry_backoff=0.001)
+    path = classify_many(["Premium fountain pen"], root, classifier)[0]
+    expected = recursive_classify("Premium fountain pen", root, LangChainLLMClassifier(model=FakeLatencyChatModel()))
+    assert codes([path]) == codes([expected])
+    # Two rate-limited attempts and one successful one per level.
+    assert model.attempts == 2 + len(path)
+    assert all(warning != "Fallback due to error." for _, _, warning in path)
@@ -0,0 +1,81 @@
+"""
+Offline tests of multi-item LLM requests, with fake chat models answering batched prompts badly.
+"""
+import json
+from typing import Any, List
+
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from classifiers import LangChainLLMClassifier, _estimate_tokens
+from fakes import NUMBERED_LINE_ITEM, FakeLatencyChatModel
+from test.hierarchy_build import build_full_hierarchy
+
+LINE_ITEMS = ["Premium fountain pen", "Economy desk organizer", "Standard paper reams", "Budget smartphone"]
+
+
+class BadBatchChatModel(FakeLatencyChatModel):
+    """
+    Fake chat model answering single-item prompts correctly and batched prompts according to `mode`:
+    "garbage" (not JSON), "omit" (no result for the second line item) or "out_of_range" (an invalid
+    index for the second line item). Records the prompts it received.
+    """
+    mode: str = "garbage"
+    prompts: List[str] = []
+
+    def _answer(self, messages: Any) -> ChatResult:
+        prompt = "\n".join(str(message.content) for message in messages)
+        self.prompts = self.prompts + [prompt]
+        answer = super()._answer(messages)
+        if not NUMBERED_LINE_ITEM.search(prompt):
+            return answer
+        if self.mode == "garbage":
+            content = "Sorry, I cannot help with that."
+        else:
+            results = json.loads(answer.generations[0].message.content)["results"]
+            if self.mode == "omit":
+                results = [result for result in results if result["item_number"] != 2]
+            else:
+                results[1]["selected_index"] = 99
+            content = json.dumps({"results": results})
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+
+def classify(mode: str):
+    model = BadBatchChatModel(mode=mode)
+    classifier = LangChainLLMClassifier(model=model, items_per_request=4)
+    candidates = build_full_hierarchy().children
+    results = classifier.classify_group(LINE_ITEMS, candidates, [None] * len(LINE_ITEMS))
+    expected = [LangChainLLMClassifier(model=FakeLatencyChatModel()).classify(line_item, candidates)
+                for line_item in LINE_ITEMS]
+    assert [result[0] for result in results] == [result[0] for result in expected]
+    return model, classifier
+
+
+def assert_every_request_is_charged(model: BadBatchChatModel, classifier: LangChainLLMClassifier):
+    savings = classifier.batch_savings()
+    assert savings["batched_items"] == len(LINE_ITEMS)
+    assert savings["batched_prompt_tokens"] == sum(_estimate_tokens(prompt) for prompt in model.prompts)
+
+
+def test_garbage_responses_are_split_down_to_single_requests():
+    model, classifier = classify("garbage")
+    # 4 items -> 2 + 2 -> 1 + 1 + 1 + 1: three batched requests, then four single ones.
+    assert len(model.prompts) == 7
+    assert_every_request_is_charged(model, classifier)
+    assert classifier.batch_savings()["tokens_saved_per_item"] < 0
+
+
+def test_line_items_missing_from_a_response_are_retried_alone():
+    model, classifier = classify("omit")
+    assert len(model.prompts) == 2
+    assert LINE_ITEMS[1] in model.prompts[1] and not NUMBERED_LINE_ITEM.search(model.prompts[1])
+    assert_every_request_is_charged(model, classifier)
+    assert classifier.batch_savings()["tokens_saved_per_item"] > 0
+
+
+def test_out_of_range_answers_are_retried_alone():
+    model, classifier = classify("out_of_range")
+    assert len(model.prompts) == 2
+    assert LINE_ITEMS[1] in model.prompts[1]
+    assert_every_request_is_charged(model, classifier)
@@ -0,0 +1,57 @@
+"""
+Offline tests of the resumable bulk-classification CLI, with the lexical classifier.
+"""
+import pandas as pd
+import pytest
+
+import cli
+from classifiers import classify_batch
+from test.test_items import get_test_line_items
+
+
+def run(input_path, output_path, *options):
+    cli.main(["classify", input_path, output_path, "--column", "line_item", "--classifier", "lexical",
+              "--chunk-size", "5", *options])
+
+
+@pytest.fixture
+def input_path(tmp_path):
+    path = str(tmp_path / "invoices.csv")
+    pd.DataFrame({"line_item": list(get_test_line_items())}).to_csv(path, index=False)
+    return path
+
+
+def test_resume_after_an_interrupted_chunk_matches_an_uninterrupted_run(tmp_path, input_path, monkeypatch):
+    expected_path = str(tmp_path / "expected.csv")
+    run(input_path, expected_path)
+
+    calls = []
+
+    def interrupted_classify_batch(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 3:
+            raise KeyboardInterrupt
+        return classify_batch(*args, **kwargs)
+
+    output_path = str(tmp_path / "results.csv")
+    monkeypatch.setattr(cli, "classify_batch", interrupted_classify_batch)
+    with pytest.raises(KeyboardInterrupt):
+        run(input_path, output_path)
+    # Output of the interrupted chunk that made it to disk without a checkpoint.
+    with open(output_path, "a") as output:
+        output.write("partial row")
+    monkeypatch.setattr(cli, "classify_batch", classify_batch)
+    run(input_path, output_path)
+
+    with open(output_path) as output, open(expected_path) as expected:
+        assert output.read() == expected.read()
+
+
+def test_existing_output_without_checkpoint_is_not_overwritten(tmp_path, input_path):
+    output_path = str(tmp_path / "results.csv")
+    with open(output_path, "w") as output:
+        output.write("earlier results")
+    with pytest.raises(ValueError, match="has no checkpoint"):
+        run(input_path, output_path)
+    with open(output_path) as output:
+        assert output.read() == "earlier results"
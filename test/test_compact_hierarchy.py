@@ -0,0 +1,50 @@
+"""
+Tests of the array-backed CompactHierarchy against the pydantic Category tree.
+"""
+from classifiers import classify_batch
+from compact_hierarchy import CompactHierarchy, MappedStrings
+from lexical_classifier import LexicalClassifier
+from test.hierarchy_build import build_full_hierarchy
+from test.test_items import get_test_line_items
+from utils import iter_hierarchy
+from vector_embedding import category_code_path
+
+
+def code_paths(paths) -> list:
+    return [[category.code for category, _, _ in path] for path in paths]
+
+
+def test_compact_tree_classifies_like_the_category_tree():
+    root = build_full_hierarchy()
+    hierarchy = CompactHierarchy.from_category(root)
+    classifier = LexicalClassifier(root)
+    line_items = list(get_test_line_items())
+    assert (code_paths(classify_batch(line_items, hierarchy.root, classifier))
+            == code_paths(classify_batch(line_items, root, classifier)))
+
+
+def test_code_paths_match_the_category_tree():
+    root = build_full_hierarchy()
+    hierarchy = CompactHierarchy.from_category(root)
+    expected = sorted(tuple(category_code_path(category)) for category, _ in iter_hierarchy(root))
+    assert sorted(hierarchy.path(i) for i in range(len(hierarchy))) == expected
+    assert all(hierarchy.find_path(path).code == path[-1] for path in expected)
+
+
+def test_save_and_load_round_trip(tmp_path):
+    root = build_full_hierarchy()
+    root.children[0].description = None
+    hierarchy = CompactHierarchy.from_category(root)
+    hierarchy.save(str(tmp_path))
+    loaded = CompactHierarchy.load(str(tmp_path))
+    # Names and descriptions are read from the memory-mapped files on access.
+    assert isinstance(loaded.names, MappedStrings) and isinstance(loaded.descriptions, MappedStrings)
+    assert [loaded.path(i) for i in range(len(loaded))] == [hierarchy.path(i) for i in range(len(hierarchy))]
+    assert list(loaded.names) == list(hierarchy.names)
+    assert list(loaded.descriptions) == list(hierarchy.descriptions)
+    assert loaded.levels.tolist() == hierarchy.levels.tolist()
+    assert loaded.to_category().ascii_tree() == root.ascii_tree()
+    line_items = list(get_test_line_items())
+    classifier = LexicalClassifier(root)
+    assert (code_paths(classify_batch(line_items, loaded.root, classifier))
+            == code_paths(classify_batch(line_items, root, classifier)))
@@ -0,0 +1,70 @@
+"""
+Tests of the store of confirmed classifications and its fast path in front of a classifier.
+"""
+import pandas as pd
+
+from classifiers import classify_batch
+from confirmed_store import ConfirmedStore, classify_batch_with_confirmed
+from lexical_classifier import LexicalClassifier
+from test.hierarchy_build import build_full_hierarchy
+
+CHAIR_PATH = ("3", "3.1", "3.1.2", "3.1.2.1")
+
+
+def jaccard(store: ConfirmedStore, first: str, second: str) -> float:
+    first, second = store._ngrams(store.normalize(first)), store._ngrams(store.normalize(second))
+    return len(first & second) / len(first | second)
+
+
+def make_store(threshold: float = 0.8) -> ConfirmedStore:
+    store = ConfirmedStore(threshold=threshold)
+    store.add_many([(f"Office supply item number {i}", ("1", "1.1", "1.1.1", "1.1.1.1")) for i in range(100)])
+    store.add("Ergonomic office chair with armrests", CHAIR_PATH)
+    return store
+
+
+def test_exact_hit_after_normalization():
+    store = make_store()
+    assert store.lookup("  ERGONOMIC office   chair with armrests") == (CHAIR_PATH, 1.0,
+                                                                       "ergonomic office chair with armrests")
+    assert store.stats()["exact_hits"] == 1
+
+
+def test_near_duplicate_matches_only_from_the_threshold_on():
+    variant = "Ergonomic office chairs with armrest"
+    similarity = jaccard(ConfirmedStore(), variant, "Ergonomic office chair with armrests")
+    assert 0.5 < similarity < 1.0
+
+    match = make_store(threshold=similarity).lookup(variant)
+    assert match is not None and match[0] == CHAIR_PATH and abs(match[1] - similarity) < 1e-12
+    below = make_store(threshold=similarity + 1e-9)
+    assert below.lookup(variant) is None
+    assert below.stats()["misses"] == 1
+
+
+def test_import_table_from_csv(tmp_path):
+    path = str(tmp_path / "reviewed.csv")
+    pd.DataFrame({"line_item": ["Desk lamp", "Stapler", "Unreviewed item"],
+                  "path_codes": ['["1", "1.3"]', '["1", "1.3", "1.3.1"]', None]}).to_csv(path, index=False)
+    store = ConfirmedStore(path=str(tmp_path / "confirmed.sqlite"))
+    assert store.import_table(path) == 2
+    # The imported paths are persisted.
+    reopened = ConfirmedStore(path=str(tmp_path / "confirmed.sqlite"))
+    assert len(reopened) == 2
+    assert reopened.lookup("stapler")[0] == ("1", "1.3", "1.3.1")
+
+
+def test_paths_missing_from_the_hierarchy_fall_back_to_the_classifier():
+    root = build_full_hierarchy()
+    classifier = LexicalClassifier(root)
+    store = ConfirmedStore()
+    store.add("Ergonomic office chair", ("3", "3.9"))
+    store.add("Premium fountain pen", ("1", "1.2", "1.2.2", "1.2.2.1"))
+    line_items = ["Ergonomic office chair", "Premium fountain pen"]
+
+    paths = classify_batch_with_confirmed(line_items, root, classifier, store)
+    codes = [[category.code for category, _, _ in path] for path in paths]
+    expected = classify_batch(line_items[:1], root, classifier)[0]
+    assert codes[0] == [category.code for category, _, _ in expected]
+    assert codes[1] == ["1", "1.2", "1.2.2", "1.2.2.1"]
+    assert all(confidence == 1.0 for _, confidence, _ in paths[1])
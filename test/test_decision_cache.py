@@ -0,0 +1,77 @@
+"""
+Offline tests of decision caching in the LLM classifiers, with the fake models.
+"""
+import time
+from typing import Any
+
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from Category import Category
+from classifiers import FullPathLLMClassifier, LangChainLLMClassifier
+from decision_cache import DecisionCache
+from fakes import FakeLatencyChatModel, FakeLatencyEmbeddings
+
+
+def build_repeated_leaf_hierarchy() -> Category:
+    root = Category(code="root", level=0, name="All Categories")
+    for name in ["Paper", "Pens"]:
+        parent = Category(code=name, level=1, name=name)
+        parent.add_child(Category(code="Standard", level=2, name="Standard"))
+        root.add_child(parent)
+    return root
+
+
+def test_full_path_cache_hit_replays_the_chosen_path():
+    model = FakeLatencyChatModel()
+    classifier = FullPathLLMClassifier(build_repeated_leaf_hierarchy(), FakeLatencyEmbeddings(), model=model,
+                                       decision_cache=DecisionCache())
+    # Both leaves have the code "Standard"; the chosen one is not the first candidate.
+    leaves = [path[-1] for path in classifier.paths]
+    first = LangChainLLMClassifier.classify(classifier, "Standard pens", leaves)
+    cached = LangChainLLMClassifier.classify(classifier, "Standard pens", leaves)
+    assert first[0] is cached[0] is leaves[1]
+    assert (model.calls, classifier.decision_cache.hits) == (1, 1)
+
+
+class GarbageChatModel(FakeLatencyChatModel):
+    """
+    Fake chat model whose answers cannot be parsed.
+    """
+
+    def _answer(self, messages: Any) -> ChatResult:
+        self.calls += 1
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="not json"))])
+
+
+def test_expired_decisions_are_misses(tmp_path, monkeypatch):
+    cache = DecisionCache(path=str(tmp_path / "decisions.sqlite"), ttl_seconds=60)
+    key = DecisionCache.key("Stapler", ["1", "2"], "fingerprint")
+    cache.put(key, ("1", 0.9, None))
+    assert cache.get(key) == ("1", 0.9, None)
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert cache.get(key) is None
+    # Also when read back from disk by another instance.
+    assert DecisionCache(path=str(tmp_path / "decisions.sqlite"), ttl_seconds=60).get(key) is None
+
+
+def test_disk_tier_keeps_the_most_recent_entries(tmp_path):
+    path = str(tmp_path / "decisions.sqlite")
+    cache = DecisionCache(path=path, max_disk_entries=5)
+    keys = [DecisionCache.key(f"item {i}", ["1"], "fingerprint") for i in range(250)]
+    for key in keys:
+        cache.put(key, ("1", 1.0, None))
+    assert cache._connection.execute("SELECT COUNT(*) FROM decisions").fetchone()[0] == 5
+    reopened = DecisionCache(path=path)
+    assert [reopened.get(key) is not None for key in keys[-6:]] == [False] + [True] * 5
+
+
+def test_fallback_decisions_are_never_cached():
+    model = GarbageChatModel()
+    classifier = LangChainLLMClassifier(model=model, decision_cache=DecisionCache())
+    candidates = build_repeated_leaf_hierarchy().children
+    for _ in range(2):
+        assert classifier.classify("Standard pens", candidates)[2] == "Fallback due to error."
+    assert model.calls == 2
+    assert classifier.decision_cache.hits == 0
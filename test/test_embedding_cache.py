@@ -0,0 +1,50 @@
+"""
+Offline tests of CachedEmbeddings against the fake embedding model.
+"""
+import numpy as np
+
+from embedding_cache import CachedEmbeddings
+from fakes import FakeLatencyEmbeddings
+
+
+def test_hits_and_misses_across_instances_sharing_a_file(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    fake = FakeLatencyEmbeddings()
+    first = CachedEmbeddings(fake, path=path)
+    first.embed_documents(["Printer paper", "Stapler", "Printer paper"])
+    # The repeated text is embedded once and counts as a hit.
+    assert (first.hits, first.misses, fake.texts) == (1, 2, 2)
+
+    second = CachedEmbeddings(fake, path=path)
+    second.embed_documents(["Printer  paper", "Stapler", "Desk lamp"])
+    # Texts equal after whitespace normalization hit the entries written by the first instance; only the new one is embedded.
+    assert (second.hits, second.misses, fake.texts) == (2, 1, 3)
+
+
+def test_lru_evicts_least_recently_used_vector():
+    cache = CachedEmbeddings(FakeLatencyEmbeddings(), path=":memory:", memory_size=2)
+    cache.embed_documents(["a", "b"])
+    cache.embed_query("a")
+    cache.embed_query("c")
+    assert list(cache._memory) == [cache._key("a"), cache._key("c")]
+    # The evicted vector is still in the SQLite tier.
+    assert cache._key("b") in cache.get_many([cache._key("b")])
+
+
+def test_miss_returns_the_float32_values_of_later_hits(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    texts = ["Ergonomic office chair", "Toner cartridge"]
+    miss = CachedEmbeddings(FakeLatencyEmbeddings(), path=path).embed_documents(texts)
+    memory_hit = CachedEmbeddings(FakeLatencyEmbeddings(), path=path)
+    disk_hit = memory_hit.embed_documents(texts)
+    assert memory_hit.misses == 0
+    assert miss == disk_hit == memory_hit.embed_documents(texts)
+    assert miss == np.asarray(miss, dtype=np.float32).tolist()
+
+
+def test_models_of_different_sizes_do_not_share_entries(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    CachedEmbeddings(FakeLatencyEmbeddings(size=256), path=path).embed_documents(["Stapler"])
+    small = CachedEmbeddings(FakeLatencyEmbeddings(size=64), path=path)
+    assert len(small.embed_query("Stapler")) == 64
+    assert small.misses == 1
@@ -0,0 +1,30 @@
+"""
+Tests of the chunked hierarchy loader.
+"""
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from excel_loaders import load_hierarchy_from_table
+
+
+def codes_by_root(roots) -> dict:
+    return {root.code: [child.code for child in root.children] for root in roots}
+
+
+@pytest.mark.parametrize("chunksize", [1, 2, 3, 100])
+def test_numeric_codes_do_not_depend_on_the_chunk_size(tmp_path, chunksize):
+    path = str(tmp_path / "hierarchy.xlsx")
+    pd.DataFrame({"L1": [10, 10, 20, 10], "L2": [101, 102, None, 103]}).to_excel(path, index=False)
+    roots = load_hierarchy_from_table(path, chunksize=chunksize)
+    assert codes_by_root(roots) == {"10": ["101", "102", "103"], "20": []}
+
+
+@pytest.mark.parametrize("chunksize", [1, 2, 3, 100])
+def test_parquet_integer_codes_with_nulls_do_not_depend_on_the_chunk_size(tmp_path, chunksize):
+    path = str(tmp_path / "hierarchy.parquet")
+    # Written with pyarrow directly, so no pandas metadata restores a nullable integer dtype.
+    pq.write_table(pa.table({"L1": [10, 10, 10, 20], "L2": pa.array([101, 102, None, 101], pa.int64())}), path)
+    roots = load_hierarchy_from_table(path, chunksize=chunksize)
+    assert codes_by_root(roots) == {"10": ["101", "102"], "20": ["101"]}
@@ -0,0 +1,23 @@
+"""
+Offline tests of saving and reusing a HierarchyVectorIndex, with the fake embedding model.
+"""
+from fakes import FakeLatencyEmbeddings
+from hierarchy_index import HierarchyVectorIndex
+from test.hierarchy_build import build_full_hierarchy
+
+
+def test_saved_index_no_longer_matches_after_a_description_edit(tmp_path):
+    directory = str(tmp_path / "index")
+    root = build_full_hierarchy()
+    HierarchyVectorIndex.build(root, FakeLatencyEmbeddings()).save(directory)
+    assert HierarchyVectorIndex.matches(directory, root, FakeLatencyEmbeddings())
+
+    root.children[0].children[0].description = "Edited description"
+    assert not HierarchyVectorIndex.matches(directory, root, FakeLatencyEmbeddings())
+
+
+def test_loaded_index_saves_the_fingerprint_it_was_built_with(tmp_path):
+    root = build_full_hierarchy()
+    HierarchyVectorIndex.build(root, FakeLatencyEmbeddings()).save(str(tmp_path / "built"))
+    HierarchyVectorIndex.load(str(tmp_path / "built"), FakeLatencyEmbeddings()).save(str(tmp_path / "copy"))
+    assert HierarchyVectorIndex.matches(str(tmp_path / "copy"), root, FakeLatencyEmbeddings())
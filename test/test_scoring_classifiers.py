@@ -0,0 +1,80 @@
+"""
+Offline tests of the behaviour shared by the scoring classifiers.
+"""
+import numpy as np
+import pytest
+
+from Category import Category
+from classifiers import ScoringClassifier, beam_classify_batch, classify_batch
+from fakes import FakeLatencyEmbeddings
+from hierarchy_index import HierarchyVectorIndex
+from lexical_classifier import LexicalClassifier
+from test.hierarchy_build import build_full_hierarchy
+
+
+@pytest.fixture(params=["index", "lexical"])
+def classifier(request) -> ScoringClassifier:
+    root = build_full_hierarchy()
+    if request.param == "index":
+        return HierarchyVectorIndex.build(root, FakeLatencyEmbeddings())
+    return LexicalClassifier(root)
+
+
+def test_candidates_outside_the_hierarchy_fall_back_to_the_last_one(classifier):
+    parent = Category(code="unknown", name="Unknown", level=1)
+    for code in ["a", "b"]:
+        parent.add_child(Category(code=code, name=code, level=2))
+    selected, confidence, warning = classifier.classify("Stapler", parent.children)
+    assert (selected, confidence) == (parent.children[-1], 0.0) and warning
+    queries = classifier.encode_batch(["Stapler", "Desk lamp"])
+    group = classifier.classify_group(["Stapler", "Desk lamp"], parent.children, queries)
+    assert [(selected, confidence) for selected, confidence, _ in group] == [(parent.children[-1], 0.0)] * 2
+
+
+def test_single_and_group_decisions_agree(classifier):
+    candidates = build_full_hierarchy().children
+    line_items = ["Ergonomic office chair", "Budget smartphone", "Printer paper"]
+    group = classifier.classify_group(line_items, candidates, classifier.encode_batch(line_items))
+    single = [classifier.classify(line_item, candidates) for line_item in line_items]
+    assert [(selected, warning) for selected, _, warning in group] == [(selected, warning) for selected, _, warning in single]
+    assert [confidence for _, confidence, _ in group] == pytest.approx([confidence for _, confidence, _ in single])
+
+
+def test_beam_of_width_one_reports_the_greedy_warnings(classifier):
+    root = build_full_hierarchy()
+    line_items = ["Standard paper", "Premium fountain pen", "Chair"]
+    greedy = classify_batch(line_items, root, classifier)
+    beams = beam_classify_batch(line_items, root, classifier, beam_width=1)
+    assert [[(category, warning) for category, _, warning in beam[0][0]] for beam in beams] == \
+           [[(category, warning) for category, _, warning in path] for path in greedy]
+    assert any(warning for path in greedy for _, _, warning in path)
+
+
+class FailingLexicalClassifier(LexicalClassifier):
+    """
+    Lexical classifier that cannot score level 2: it raises, or scores no candidate with `unscored`.
+    """
+
+    def __init__(self, root, unscored: bool):
+        super().__init__(root)
+        self.unscored = unscored
+
+    def score_group(self, line_items, candidates, queries):
+        scores = super().score_group(line_items, candidates, queries)
+        if candidates[0].level == 2:
+            if not self.unscored:
+                raise RuntimeError("Scoring failed")
+            scores[:] = -np.inf
+        return scores
+
+
+@pytest.mark.parametrize("unscored", [False, True])
+def test_beam_falls_back_where_a_node_cannot_be_scored(unscored):
+    root = build_full_hierarchy()
+    classifier = FailingLexicalClassifier(root, unscored)
+    for alternatives in beam_classify_batch(["Premium fountain pen", "Budget smartphone"], root, classifier):
+        for path, score in alternatives:
+            assert np.isfinite(score)
+            category, confidence, warning = path[1]
+            assert (category, confidence) == (path[0][0].children[-1], 0.0) and warning
+            assert len(path) == 4
@@ -0,0 +1,116 @@
+"""
+Offline tests of the micro-batching classification service, with the lexical classifier.
+"""
+import asyncio
+import json
+import threading
+
+from lexical_classifier import LexicalClassifier
+from service import MicroBatcher, start_server
+from test.hierarchy_build import build_full_hierarchy
+
+
+class GatedClassifier(LexicalClassifier):
+    """
+    Lexical classifier whose batches wait for `gate`, so the batcher's queue can be filled up.
+    """
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.gate = threading.Event()
+
+    def encode_batch(self, line_items):
+        self.gate.wait(timeout=5)
+        return super().encode_batch(line_items)
+
+
+def test_cancelled_first_request_does_not_cancel_coalesced_ones():
+    async def scenario():
+        root = build_full_hierarchy()
+        classifier = GatedClassifier(root)
+        batcher = MicroBatcher(root, classifier, max_batch_size=1, max_wait=0, max_queue_size=1)
+        await batcher.start()
+        # The first line item is being classified and the second fills the queue, so the first
+        # request for the third waits for room.
+        requests = [asyncio.create_task(batcher.classify(line_item))
+                    for line_item in ["Budget smartphone", "Premium fountain pen", "Desk lamp"]]
+        await asyncio.sleep(0.05)
+        coalesced = asyncio.create_task(batcher.classify("Desk lamp"))
+        await asyncio.sleep(0.05)
+        requests[2].cancel()
+        classifier.gate.set()
+        path = await asyncio.wait_for(coalesced, 5)
+        await batcher.stop()
+        return requests[2].cancelled(), path, batcher.stats()
+
+    cancelled, path, stats = asyncio.run(scenario())
+    assert cancelled
+    assert len(path) == 4
+    assert (stats["coalesced"], stats["batches"]) == (1, 3)
+
+
+class PoisonedClassifier(LexicalClassifier):
+    """
+    Lexical classifier failing every batch that contains "poison".
+    """
+
+    def encode_batch(self, line_items):
+        if "poison" in line_items:
+            raise ValueError("Cannot classify poison.")
+        return super().encode_batch(line_items)
+
+
+def test_bad_line_item_only_fails_its_own_request():
+    async def scenario():
+        root = build_full_hierarchy()
+        batcher = MicroBatcher(root, PoisonedClassifier(root), max_batch_size=8, max_wait=0.05)
+        await batcher.start()
+        results = await asyncio.gather(*(batcher.classify(line_item) for line_item
+                                         in ["Budget smartphone", "poison", "Desk lamp"]),
+                                       return_exceptions=True)
+        await batcher.stop()
+        return results
+
+    smartphone, poison, lamp = asyncio.run(scenario())
+    assert isinstance(poison, ValueError)
+    assert len(smartphone) == 4 and len(lamp) == 4
+
+
+def test_stop_cancels_pending_requests():
+    async def scenario():
+        root = build_full_hierarchy()
+        classifier = GatedClassifier(root)
+        batcher = MicroBatcher(root, classifier, max_batch_size=1, max_wait=0)
+        await batcher.start()
+        requests = [asyncio.create_task(batcher.classify(line_item))
+                    for line_item in ["Budget smartphone", "Premium fountain pen"]]
+        await asyncio.sleep(0.05)
+        classifier.gate.set()
+        await batcher.stop()
+        return await asyncio.wait_for(asyncio.gather(*requests, return_exceptions=True), 5)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, asyncio.CancelledError) for result in results)
+
+
+def test_server_rejects_non_string_line_item_only_for_its_request():
+    async def scenario():
+        root = build_full_hierarchy()
+        batcher = MicroBatcher(root, LexicalClassifier(root), max_batch_size=8, max_wait=0.05)
+        await batcher.start()
+        server = await start_server(batcher.classify, port=0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        for i, line_item in enumerate(["Budget smartphone", 123, "Desk lamp"]):
+            writer.write(json.dumps({"id": i, "line_item": line_item}).encode("utf-8") + b"\n")
+        await writer.drain()
+        responses = [json.loads(await asyncio.wait_for(reader.readline(), 5)) for _ in range(3)]
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        await batcher.stop()
+        return {response["id"]: response for response in responses}
+
+    responses = asyncio.run(scenario())
+    assert "line_item must be a string" in responses[1]["error"]
+    assert "error" not in responses[0] and "error" not in responses[2]
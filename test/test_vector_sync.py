@@ -0,0 +1,47 @@
+"""
+Offline tests of the incremental hierarchy sync into Chroma, with the fake embedding model.
+"""
+import uuid
+
+import chromadb
+import pytest
+from langchain_chroma import Chroma
+
+from fakes import FakeLatencyEmbeddings
+from test.hierarchy_build import build_full_hierarchy
+from vector_embedding import iter_hierarchy_documents, sync_hierarchy_into_chroma
+
+
+def make_vectorstore() -> Chroma:
+    return Chroma(collection_name=f"sync-{uuid.uuid4().hex}", embedding_function=FakeLatencyEmbeddings(),
+                  client=chromadb.EphemeralClient())
+
+
+def test_unchanged_sync_embeds_nothing():
+    vectorstore = make_vectorstore()
+    root = build_full_hierarchy()
+    assert sync_hierarchy_into_chroma(vectorstore, root)["embedded"] > 0
+    stats = sync_hierarchy_into_chroma(vectorstore, root)
+    assert stats["embedded"] == 0
+    assert stats["deleted"] == 0
+
+
+def test_editing_one_node_embeds_one_document():
+    vectorstore = make_vectorstore()
+    root = build_full_hierarchy()
+    sync_hierarchy_into_chroma(vectorstore, root)
+    root.children[0].children[0].description = "Edited description"
+    stats = sync_hierarchy_into_chroma(vectorstore, root)
+    assert stats["embedded"] == 1
+    assert stats["deleted"] == 0
+
+
+def test_subtree_documents_get_the_ids_of_a_full_traversal():
+    root = build_full_hierarchy()
+    ids = {doc.metadata["code"]: doc.id for doc in iter_hierarchy_documents(root)}
+    subtree = root.children[1].children[2]
+    documents = list(iter_hierarchy_documents(subtree, parent_path=[root.name, root.children[1].name],
+                                              parent_codes=[root.code, root.children[1].code]))
+    assert documents and all(doc.id == ids[doc.metadata["code"]] for doc in documents)
+    with pytest.raises(ValueError):
+        next(iter_hierarchy_documents(subtree, parent_path=[root.name, root.children[1].name]))
@@ -1,8 +1,48 @@
+import itertools
+from typing import Iterable, Iterator, Tuple
+
+import numpy as np
+
 from Category import Category
 
 
+def iter_hierarchy(node: Category, level: int = 0) -> Iterator[Tuple[Category, int]]:
+    """
+    Depth-first walk of the hierarchy yielding (category, level) pairs, parents before children.
+    Iterative, so deep trees do not hit the recursion limit.
+    """
+    stack = [(node, level)]
+    while stack:
+        node, level = stack.pop()
+        yield node, level
+        stack.extend((child, level + 1) for child in reversed(node.children))
+
+
 def print_hierarchy(node: Category, level: int = 0):
-    indent = "  " * level
-    print(f"{indent}- {node.name} (Code: {node.code})")
-    for child in node.children:
-        print_hierarchy(child, level + 1)
+    for category, category_level in iter_hierarchy(node, level):
+        indent = "  " * category_level
+        print(f"{indent}- {category.name} (Code: {category.code})")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize a text before hashing, so trivially different spellings share a cache entry.
+    """
+    return " ".join(text.split())
+
+
+def batched(items: Iterable, batch_size: int) -> Iterator[list]:
+    """
+    Consecutive lists of up to `batch_size` items, read lazily from any iterable.
+    """
+    iterator = iter(items)
+    while batch := list(itertools.islice(iterator, batch_size)):
+        yield batch
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """
+    L2-normalize vectors along the last axis, leaving zero vectors as they are.
+    """
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
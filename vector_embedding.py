@@ -1,56 +1,114 @@
-from typing import List
+import hashlib
+from typing import Dict, Iterator, List, Optional
+from langchain_core.embeddings import Embeddings
 from langchain_openai import OpenAIEmbeddings
 from langchain_chroma import Chroma
 from langchain.schema import Document
 
 from Category import Category
+from embedding_cache import CachedEmbeddings
 from test.hierarchy_build import build_full_hierarchy
+from utils import batched
 
 
+def category_to_text(category: Category) -> str:
+    """
+    Text that is embedded for a category.
+    """
+    return (
+        f"Category Name: {category.name}\n"
+        f"Code: {category.code}\n"
+        f"Description: {category.description}"
+    )
+
+
+def category_document_id(code_path: List[str]) -> str:
+    """
+    Deterministic document ID of a category, derived from the codes along its path from the root.
+    The same category therefore always maps to the same row of the vector store.
+    """
+    return hashlib.sha1("/".join(code_path).encode("utf-8")).hexdigest()
+
+
+def category_code_path(category: Category) -> List[str]:
+    """
+    Codes along the path from the root down to the category.
+    """
+    code_path = []
+    while category is not None:
+        code_path.append(category.code)
+        category = category.parent
+    return code_path[::-1]
+
 
-def hierarchy_to_documents(category: Category, parent_path: List[str] = None) -> List[Document]:
+def iter_hierarchy_documents(category: Category, parent_path: List[str] = None,
+                             parent_codes: List[str] = None) -> Iterator[Document]:
     """
-    Recursively traverse the Category hierarchy and convert each category to a Document.
+    Traverse the Category hierarchy depth-first (iteratively, so deep trees do not hit the recursion
+    limit) and lazily yield each category as a Document, parents before their children.
+    Each Document gets a stable ID from `category_document_id`.
+    The root of a CompactHierarchy (`CompactHierarchy.root`) can be passed instead of a Category.
 
     Metadata includes:
       - "level": the depth of the category (0 for the root)
       - "code": the category code
       - "L0", "L1", ... representing the parent category names along the path.
-    """
-    if parent_path is None:
-        parent_path = []
-    # The current level is the length of the parent path.
-    current_level = len(parent_path)
-
-    # Build metadata including parent's path
-    metadata = {"level": current_level, "code": category.code, 'name': category.name}
-    for i, parent in enumerate(parent_path):
-        metadata[f"L{i}"] = parent
-
-    # Create the Document for the current category.
-    doc = Document(
-        page_content=(
-            f"Category Name: {category.name}\n"
-            f"Code: {category.code}\n"
-            f"Description: {category.description}"
-        ),
-        metadata=metadata
-    )
-    docs = [doc]
+      - "parent_id": the document ID of the parent ("" for the root), so the children of a node
+        are selected with a single equality filter on an indexed key.
+      - "content_hash": a hash of the embedded text, used to detect changed categories.
 
-    # Update the parent path for children (include the current category's name)
-    new_parent_path = parent_path + [category.name]
-    for child in category.children:
-        docs.extend(hierarchy_to_documents(child, new_parent_path))
-    return docs
+    To traverse a subtree, pass the names and the codes of its ancestors (root first) as
+    `parent_path` and `parent_codes`; both are needed, so the IDs match those of a full traversal.
+    """
+    if len(parent_path or []) != len(parent_codes or []):
+        raise ValueError("parent_path and parent_codes must name the same ancestors.")
+    # Names and codes along the path to the current category, shared by the whole traversal
+    # and truncated to the depth of each visited category instead of copied per node.
+    names = list(parent_path or [])
+    codes = list(parent_codes or [])
+    base_level = len(names)
+    stack = [(category, base_level, category_document_id(codes) if codes else "")]
+    while stack:
+        category, current_level, parent_id = stack.pop()
+        del names[current_level:], codes[current_level:]
+
+        page_content = category_to_text(category)
+        # Build metadata including parent's path
+        metadata = {"level": current_level, "code": category.code, 'name': category.name,
+                    "content_hash": hashlib.sha256(page_content.encode("utf-8")).hexdigest()}
+        for i, parent in enumerate(names):
+            metadata[f"L{i}"] = parent
+        metadata["parent_id"] = parent_id
+
+        codes.append(category.code)
+        names.append(category.name)
+        doc_id = category_document_id(codes)
+        yield Document(id=doc_id, page_content=page_content, metadata=metadata)
+
+        # Reversed, so children are visited in their original order.
+        stack.extend((child, current_level + 1, doc_id) for child in reversed(category.children))
+
+
+def hierarchy_to_documents(category: Category, parent_path: List[str] = None,
+                           parent_codes: List[str] = None) -> List[Document]:
+    """
+    All Documents of `iter_hierarchy_documents` as a list.
+    """
+    return list(iter_hierarchy_documents(category, parent_path, parent_codes))
 
 
 # ---------------------------------------------------------------------------
 # 3. Load Hierarchy into a Chroma Vector Store
 # ---------------------------------------------------------------------------
-def get_vector_store(persist_directory: str = "./chroma_langchain_db") -> Chroma:
-    # Initialize OpenAIEmbeddings (make sure OPENAI_API_KEY is set in your environment).
-    embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
+def get_vector_store(persist_directory: str = "./chroma_langchain_db",
+                     embedding_cache_path: Optional[str] = "./embedding_cache.sqlite",
+                     embeddings: Optional[Embeddings] = None) -> Chroma:
+    if embeddings is None:
+        # Initialize OpenAIEmbeddings (make sure OPENAI_API_KEY is set in your environment).
+        embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
+        # Reuse embeddings of texts seen in earlier runs; pass embedding_cache_path=None to disable.
+        if embedding_cache_path is not None:
+            embeddings = CachedEmbeddings(embeddings, path=embedding_cache_path)
 
     return Chroma(
         collection_name="categories",
@@ -59,21 +117,76 @@ def get_vector_store(persist_directory: str = "./chroma_langchain_db") -> Chroma
     )
 
 
+def sync_hierarchy_into_chroma(vectorstore: Chroma, root_category: Category,
+                               batch_size: int = 1000) -> Dict[str, int]:
+    """
+    Bring the vector store in line with the hierarchy, embedding only what changed:
+      - new categories, or categories whose text changed, are embedded and upserted,
+      - categories whose text is unchanged but whose metadata (e.g. parent path) changed
+        get their metadata updated without re-embedding,
+      - rows that are no longer in the hierarchy are deleted.
+
+    Documents are streamed from the hierarchy and compared, embedded and written in batches of
+    `batch_size`, so memory stays bounded by the batch size (plus the set of document IDs).
+
+    Returns the number of documents in each of the categories above (plus "unchanged").
+    """
+    stats = {"embedded": 0, "metadata_updated": 0, "deleted": 0, "unchanged": 0}
+    current_ids = set()
+    for batch in batched(iter_hierarchy_documents(root_category), batch_size):
+        existing = vectorstore.get(ids=[doc.id for doc in batch], include=["metadatas"])
+        existing_metadata = dict(zip(existing["ids"], existing["metadatas"]))
+
+        to_embed, to_update = [], []
+        for doc in batch:
+            current_ids.add(doc.id)
+            metadata = existing_metadata.get(doc.id)
+            if metadata is None or metadata.get("content_hash") != doc.metadata["content_hash"]:
+                to_embed.append(doc)
+            elif metadata != doc.metadata:
+                to_update.append(doc)
+        if to_embed:
+            vectorstore.add_documents(to_embed, ids=[doc.id for doc in to_embed])
+        if to_update:
+            vectorstore._collection.update(ids=[doc.id for doc in to_update],
+                                           metadatas=[doc.metadata for doc in to_update])
+        stats["embedded"] += len(to_embed)
+        stats["metadata_updated"] += len(to_update)
+        stats["unchanged"] += len(batch) - len(to_embed) - len(to_update)
+
+    # Page through the stored IDs to find rows that are no longer in the hierarchy.
+    to_delete = []
+    for offset in range(0, vectorstore._collection.count(), batch_size):
+        page = vectorstore.get(limit=batch_size, offset=offset, include=[])
+        to_delete.extend(doc_id for doc_id in page["ids"] if doc_id not in current_ids)
+    for batch in batched(to_delete, batch_size):
+        vectorstore.delete(ids=batch)
+    stats["deleted"] = len(to_delete)
+    return stats
+
+
 def load_hierarchy_into_chroma(root_category: Category,
-                               persist_directory: str = "./chroma_langchain_db") -> Chroma:
+                               persist_directory: str = "./chroma_langchain_db",
+                               sync: bool = True, batch_size: int = 1000) -> Chroma:
     """
-    Given the root Category, converts the entire hierarchy into a list of Documents,
+    Given the root Category, converts the entire hierarchy into Documents,
     creates OpenAIEmbeddings, and initializes a Chroma vector store.
 
     The persist_directory parameter specifies where the Chroma DB files should be stored.
+    With `sync=True` (default) only new or changed categories are embedded and removed ones are
+    deleted (see `sync_hierarchy_into_chroma`), so re-running on an unchanged hierarchy is free.
+    With `sync=False` every category is re-embedded and upserted under its stable ID.
+    Either way documents are streamed into the store, embedded `batch_size` at a time.
     """
-    # Convert the hierarchy to Document objects.
-    docs = hierarchy_to_documents(root_category)
-
     # Create a Chroma vector store from the documents.
     vectorstore = get_vector_store(persist_directory=persist_directory)
 
-    vectorstore.add_documents(docs)
+    if sync:
+        stats = sync_hierarchy_into_chroma(vectorstore, root_category, batch_size=batch_size)
+        print(f"Hierarchy synced into Chroma: {stats}")
+    else:
+        for batch in batched(iter_hierarchy_documents(root_category), batch_size):
+            vectorstore.add_documents(batch, ids=[doc.id for doc in batch])
     return vectorstore
 
 